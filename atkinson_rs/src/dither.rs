@@ -0,0 +1,271 @@
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::thread;
+
+/// A row may only be processed up to pixel x once the row above has finished
+/// pixel x + ROW_LAG - 1. Atkinson reaches one pixel sideways into the next
+/// row and two pixels ahead in the current row, so with this lag no two rows
+/// ever touch the same pixel at the same time, and every pixel has received
+/// all of its error by the time it is visited.
+const ROW_LAG: usize = 4;
+
+/// Row progress is published every this many pixels, to keep the cache line
+/// holding the counter from bouncing between cores on every pixel.
+const PUBLISH_EVERY: usize = 32;
+
+/// Busy-wait iterations before a waiting row starts yielding its core.
+const SPIN_LIMIT: u32 = 64;
+
+#[inline(always)]
+fn clamp_u8(v: i16) -> u8 {
+    if v < 0 { 0 } else if v > 255 { 255 } else { v as u8 }
+}
+
+#[inline(always)]
+fn div8_round(v: i16) -> i16 {
+    if v >= 0 { (v + 4) / 8 } else { -((-v + 4) / 8) }
+}
+
+#[inline(always)]
+fn lut_index(r: u8, g: u8, b: u8, bits: u32) -> usize {
+    let shift = 8 - bits;
+    (((r as usize) >> shift) << (2 * bits)) | (((g as usize) >> shift) << bits) | ((b as usize) >> shift)
+}
+
+/// Grid bits per channel of a LUT with `len` entries, 5 to 8.
+pub fn lut_bits(len: usize) -> Option<u32> {
+    (5..=8).find(|&bits| len == 1 << (3 * bits))
+}
+
+pub struct Kernel<'a> {
+    pub width: usize,
+    pub height: usize,
+    /// RGB LUT with 2^lut_bits entries per channel, every entry must be a valid palette index
+    pub lut: &'a [u8],
+    pub lut_bits: u32,
+    /// Palette as i16 RGB triplets
+    pub palette: Vec<i16>,
+    pub serpentine: bool,
+}
+
+/// Raw pointer that may be shared between the wavefront workers.
+#[derive(Clone, Copy)]
+struct SharedPtr<T>(*mut T);
+
+unsafe impl<T> Send for SharedPtr<T> {}
+unsafe impl<T> Sync for SharedPtr<T> {}
+
+impl<T> SharedPtr<T> {
+    // Going through a method makes closures capture the whole Send wrapper, not the raw field
+    fn get(self) -> *mut T {
+        self.0
+    }
+}
+
+impl Kernel<'_> {
+    /// Rolling error buffer: three rows of i16 RGB, since Atkinson only diffuses
+    /// into the current row and the two below it.
+    ///
+    /// Row y uses slot y % 3. Each pixel's error is cleared as soon as it has been
+    /// read, so a slot is clean again by the time row y + 3 starts diffusing into
+    /// it, and the rows above it never write that far ahead.
+    pub fn error_rows(&self) -> Vec<i16> {
+        vec![0i16; 3 * self.width * 3]
+    }
+
+    /// Dither the whole RGB image into palette indices.
+    pub fn run(&self, rgb: &[u8], out: &mut [u8], threads: usize) {
+        self.run_rows(rgb, out, &mut self.error_rows(), 0, threads);
+    }
+
+    /// Dither a band of rows starting at row `y0`, one row after the other.
+    ///
+    /// `rgb` and `out` hold only the band. `err` carries the error diffused
+    /// past the band into the next call, so dithering an image band by band
+    /// gives the same output as dithering it in one go.
+    pub fn run_rows_serial(&self, rgb: &[u8], out: &mut [u8], err: &mut [i16], y0: usize) {
+        let rows = self.band_rows(rgb, out, err, y0);
+
+        for y in y0..y0 + rows {
+            // SAFETY: the buffers have the sizes checked by band_rows and are borrowed exclusively
+            unsafe { self.dither_row(rgb.as_ptr(), err.as_mut_ptr(), out.as_mut_ptr(), y0, y, |_| {}, |_| {}) };
+        }
+    }
+
+    /// Dither a band with its rows spread over `threads` workers in a staggered wavefront.
+    ///
+    /// Gives exactly the same output as `run_rows_serial`: error terms are plain
+    /// integer additions, and every pixel has received all of them before it
+    /// is visited.
+    ///
+    /// Serpentine dithering always runs serially. A reversed row needs the
+    /// last pixels of the row above before its first one, and the row below
+    /// it needs its last pixel in turn, so no two rows ever overlap.
+    pub fn run_rows(&self, rgb: &[u8], out: &mut [u8], err: &mut [i16], y0: usize, threads: usize) {
+        let rows = self.band_rows(rgb, out, err, y0);
+
+        let threads = threads.min(rows);
+        if self.serpentine || threads <= 1 {
+            self.run_rows_serial(rgb, out, err, y0);
+            return;
+        }
+
+        let progress: Vec<AtomicUsize> = (0..rows).map(|_| AtomicUsize::new(0)).collect();
+        let err = SharedPtr(err.as_mut_ptr());
+        let out = SharedPtr(out.as_mut_ptr());
+
+        thread::scope(|scope| {
+            for first_row in 0..threads {
+                let progress = &progress;
+                scope.spawn(move || {
+                    for y in (y0 + first_row..y0 + rows).step_by(threads) {
+                        // The rows above the band were finished by an earlier call
+                        let mut above_done = if y == y0 { self.width } else { 0 };
+
+                        let wait = |x: usize| {
+                            let needed = (x + ROW_LAG).min(self.width);
+                            let mut spins = 0;
+                            while above_done < needed {
+                                above_done = progress[y - y0 - 1].load(Ordering::Acquire);
+                                if above_done >= needed {
+                                    break;
+                                }
+                                if spins < SPIN_LIMIT {
+                                    spins += 1;
+                                    std::hint::spin_loop();
+                                } else {
+                                    thread::yield_now();
+                                }
+                            }
+                        };
+                        let publish = |x: usize| {
+                            let done = x + 1;
+                            if done % PUBLISH_EVERY == 0 || done == self.width {
+                                progress[y - y0].store(done, Ordering::Release);
+                            }
+                        };
+
+                        // SAFETY: rows only touch pixels the row lag hands to them, and the
+                        // acquire/release pairs on `progress` order the accesses between rows
+                        unsafe { self.dither_row(rgb.as_ptr(), err.get(), out.get(), y0, y, wait, publish) };
+                    }
+                });
+            }
+        });
+    }
+
+    /// Number of rows in a band, after checking the buffer sizes.
+    fn band_rows(&self, rgb: &[u8], out: &[u8], err: &[i16], y0: usize) -> usize {
+        let rows = out.len() / self.width.max(1);
+        assert_eq!(out.len(), rows * self.width);
+        assert_eq!(rgb.len(), rows * self.width * 3);
+        assert_eq!(err.len(), 3 * self.width * 3);
+        assert!(y0 + rows <= self.height);
+        rows
+    }
+
+    /// Dither row `y` of the band starting at row `y0`. `wait(x)` is called
+    /// before pixel x is read and `publish(x)` after all of its error has been spread.
+    ///
+    /// SAFETY: `rgb` and `out` must point to the band's rows (width*3 and width
+    /// elements each) and `err` to 3*width*3 elements, and no other thread may
+    /// access the pixels this touches.
+    #[inline(always)]
+    unsafe fn dither_row(
+        &self,
+        rgb: *const u8,
+        err: *mut i16,
+        out: *mut u8,
+        y0: usize,
+        y: usize,
+        mut wait: impl FnMut(usize),
+        mut publish: impl FnMut(usize),
+    ) {
+        let width = self.width;
+        let height = self.height;
+
+        let odd = (y & 1) == 1;
+        let (x_start, x_end, dir): (isize, isize, isize) = if self.serpentine && odd {
+            (width as isize - 1, -1, -1)
+        } else {
+            (0, width as isize, 1)
+        };
+
+        let row = |y: usize| (y % 3) * width * 3;
+        let add = |p: usize, er: i16, eg: i16, eb: i16| unsafe {
+            *err.add(p) += er;
+            *err.add(p + 1) += eg;
+            *err.add(p + 2) += eb;
+        };
+
+        let mut x = x_start;
+        while x != x_end {
+            let xi = x as usize;
+            wait(xi);
+
+            let pix = ((y - y0) * width + xi) * 3;
+            let e = row(y) + xi * 3;
+
+            // pixel plus diffused error, clamped. The error is taken out of the ring
+            let (r, g, b) = unsafe {
+                let r = clamp_u8(*rgb.add(pix) as i16 + *err.add(e));
+                let g = clamp_u8(*rgb.add(pix + 1) as i16 + *err.add(e + 1));
+                let b = clamp_u8(*rgb.add(pix + 2) as i16 + *err.add(e + 2));
+                *err.add(e) = 0;
+                *err.add(e + 1) = 0;
+                *err.add(e + 2) = 0;
+                (r, g, b)
+            };
+
+            // LUT -> palette index
+            let idx = self.lut[lut_index(r, g, b, self.lut_bits)] as usize;
+            unsafe { *out.add((y - y0) * width + xi) = idx as u8 };
+
+            // chosen palette color
+            let pr = self.palette[idx * 3];
+            let pg = self.palette[idx * 3 + 1];
+            let pb = self.palette[idx * 3 + 2];
+
+            // error /8 rounded
+            let er = div8_round(r as i16 - pr);
+            let eg = div8_round(g as i16 - pg);
+            let eb = div8_round(b as i16 - pb);
+
+            let x1 = x + dir;
+            let x2 = x + 2 * dir;
+            let y1 = y + 1;
+            let y2 = y + 2;
+
+            // (x+1, y)
+            if x1 >= 0 && (x1 as usize) < width {
+                add(row(y) + x1 as usize * 3, er, eg, eb);
+            }
+            // (x+2, y)
+            if x2 >= 0 && (x2 as usize) < width {
+                add(row(y) + x2 as usize * 3, er, eg, eb);
+            }
+
+            // next row
+            if y1 < height {
+                // (x-1, y+1)
+                let xm1 = x - dir;
+                if xm1 >= 0 && (xm1 as usize) < width {
+                    add(row(y1) + xm1 as usize * 3, er, eg, eb);
+                }
+                // (x, y+1)
+                add(row(y1) + xi * 3, er, eg, eb);
+                // (x+1, y+1)
+                if x1 >= 0 && (x1 as usize) < width {
+                    add(row(y1) + x1 as usize * 3, er, eg, eb);
+                }
+            }
+
+            // (x, y+2)
+            if y2 < height {
+                add(row(y2) + xi * 3, er, eg, eb);
+            }
+
+            publish(xi);
+            x += dir;
+        }
+    }
+}
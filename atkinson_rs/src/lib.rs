@@ -1,147 +1,246 @@
+use pyo3::buffer::PyBuffer;
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
 use pyo3::types::PyBytes;
 
-#[inline(always)]
-fn clamp_u8(v: i16) -> u8 {
-    if v < 0 { 0 } else if v > 255 { 255 } else { v as u8 }
-}
+mod dither;
+
+use dither::{lut_bits, Kernel};
+
+/// Validate the LUT and palette and set up the dithering kernel.
+fn kernel<'a>(
+    width: usize,
+    height: usize,
+    lut_buf: &'a [u8],
+    pal_buf: &[u8],
+    serpentine: bool,
+) -> PyResult<Kernel<'a>> {
+    let Some(bits) = lut_bits(lut_buf.len()) else {
+        return Err(PyValueError::new_err("lut must have 2^(3*bits) entries with bits in 5..=8"));
+    };
+    if pal_buf.len() % 3 != 0 || pal_buf.is_empty() {
+        return Err(PyValueError::new_err("palette length must be K*3 with K>=1"));
+    }
+    let k = pal_buf.len() / 3;
 
-#[inline(always)]
-fn div8_round(v: i16) -> i16 {
-    if v >= 0 { (v + 4) / 8 } else { -((-v + 4) / 8) }
+    if let Some(&bad) = lut_buf.iter().find(|&&idx| idx as usize >= k) {
+        return Err(PyValueError::new_err(format!("lut index {bad} out of palette bounds")));
+    }
+
+    Ok(Kernel {
+        width,
+        height,
+        lut: lut_buf,
+        lut_bits: bits,
+        palette: pal_buf.iter().map(|&v| v as i16).collect(),
+        serpentine,
+    })
 }
 
-#[inline(always)]
-fn lut_index_5bit(r: u8, g: u8, b: u8) -> usize {
-    (((r as usize) >> 3) << 10) | (((g as usize) >> 3) << 5) | ((b as usize) >> 3)
+fn resolve_threads(threads: usize) -> usize {
+    if threads == 0 {
+        std::thread::available_parallelism().map_or(1, |n| n.get())
+    } else {
+        threads
+    }
 }
 
+/// Atkinson dither an RGB image to palette indices through an RGB LUT.
+///
+/// The LUT resolution (5 to 8 bits per channel) follows from its length, entry
+/// (r >> (8-bits)) << 2*bits | (g >> (8-bits)) << bits | (b >> (8-bits)) holds the
+/// palette index for that color.
+///
+/// `threads` > 1 spreads the rows over that many threads in a wavefront, 0 uses
+/// every core. The output is identical to the single threaded one. Serpentine
+/// scanning can not be parallelised and always runs on one thread.
 #[pyfunction]
+#[pyo3(signature = (rgb, width, height, lut, palette, serpentine, threads = 1))]
 fn atkinson_lut<'py>(
     py: Python<'py>,
     rgb: &Bound<'py, PyBytes>,      // bytes length = width*height*3
     width: usize,
     height: usize,
-    lut: &Bound<'py, PyBytes>,      // bytes length = 32768 (5-bit LUT)
+    lut: &Bound<'py, PyBytes>,      // bytes length = 2^(3*bits), bits in 5..=8
     palette: &Bound<'py, PyBytes>,  // bytes length = K*3
     serpentine: bool,
+    threads: usize,
 ) -> PyResult<Bound<'py, PyBytes>> {
     let rgb_buf = rgb.as_bytes();
-    let lut_buf = lut.as_bytes();
-    let pal_buf = palette.as_bytes();
 
     if rgb_buf.len() != width * height * 3 {
-        return Err(pyo3::exceptions::PyValueError::new_err("rgb buffer has wrong length"));
+        return Err(PyValueError::new_err("rgb buffer has wrong length"));
     }
-    if lut_buf.len() != 32768 {
-        return Err(pyo3::exceptions::PyValueError::new_err("lut must have length 32768 for 5-bit LUT"));
+    let kernel = kernel(width, height, lut.as_bytes(), palette.as_bytes(), serpentine)?;
+    let threads = resolve_threads(threads);
+
+    // bytes are immutable, so their contents can be read without the GIL
+    let out = py.detach(|| {
+        let mut out: Vec<u8> = vec![0u8; width * height];
+        kernel.run(rgb_buf, &mut out, threads);
+        out
+    });
+
+    Ok(PyBytes::new(py, &out))
+}
+
+/// Like `atkinson_lut`, but reads the image from any C-contiguous uint8 buffer
+/// (e.g. a (H,W,3) NumPy array) and writes the palette indices into the
+/// caller's writable `out` buffer of width*height bytes.
+///
+/// The GIL is released while dithering, so other Python threads keep running.
+/// Neither buffer may be modified by them until this returns.
+#[pyfunction]
+#[pyo3(signature = (rgb, width, height, lut, palette, out, serpentine, threads = 1))]
+fn atkinson_lut_into<'py>(
+    py: Python<'py>,
+    rgb: &Bound<'py, PyAny>,
+    width: usize,
+    height: usize,
+    lut: &Bound<'py, PyBytes>,
+    palette: &Bound<'py, PyBytes>,
+    out: &Bound<'py, PyAny>,
+    serpentine: bool,
+    threads: usize,
+) -> PyResult<()> {
+    let rgb_buf: PyBuffer<u8> = PyBuffer::get(rgb)?;
+    let out_buf: PyBuffer<u8> = PyBuffer::get(out)?;
+
+    let n = width * height;
+    if !rgb_buf.is_c_contiguous() || rgb_buf.item_count() != n * 3 {
+        return Err(PyValueError::new_err("rgb must be a C-contiguous uint8 buffer of width*height*3"));
     }
-    if pal_buf.len() % 3 != 0 || pal_buf.is_empty() {
-        return Err(pyo3::exceptions::PyValueError::new_err("palette length must be K*3 with K>=1"));
+    if out_buf.readonly() || !out_buf.is_c_contiguous() || out_buf.item_count() != n {
+        return Err(PyValueError::new_err("out must be a writable C-contiguous uint8 buffer of width*height"));
     }
-    let k = pal_buf.len() / 3;
 
-    // Palette i16
-    let mut pal_i16: Vec<i16> = Vec::with_capacity(pal_buf.len());
-    pal_i16.extend(pal_buf.iter().map(|&v| v as i16));
+    let rgb_start = rgb_buf.buf_ptr() as usize;
+    let out_start = out_buf.buf_ptr() as usize;
+    if rgb_start < out_start + n && out_start < rgb_start + n * 3 {
+        return Err(PyValueError::new_err("rgb and out must not overlap"));
+    }
 
-    // Work buffer i16 RGB
-    let mut buf: Vec<i16> = Vec::with_capacity(rgb_buf.len());
-    buf.extend(rgb_buf.iter().map(|&v| v as i16));
+    let kernel = kernel(width, height, lut.as_bytes(), palette.as_bytes(), serpentine)?;
+    let threads = resolve_threads(threads);
 
-    let mut out: Vec<u8> = vec![0u8; width * height];
+    // Pointers travel as plain addresses, the buffers stay exported (and so
+    // alive and fixed in place) until rgb_buf and out_buf are dropped
+    py.detach(|| {
+        // SAFETY: both buffers were checked for size, contiguity and overlap above
+        let rgb = unsafe { std::slice::from_raw_parts(rgb_start as *const u8, n * 3) };
+        let out = unsafe { std::slice::from_raw_parts_mut(out_start as *mut u8, n) };
+        kernel.run(rgb, out, threads);
+    });
 
-    for y in 0..height {
-        let odd = (y & 1) == 1;
-        let (x_start, x_end, dir): (isize, isize, isize) = if serpentine && odd {
-            (width as isize - 1, -1, -1)
-        } else {
-            (0, width as isize, 1)
-        };
+    Ok(())
+}
 
-        let mut x = x_start;
-        while x != x_end {
-            let xi = x as usize;
-            let pix = (y * width + xi) * 3;
-
-            // clamp pixel
-            let r = clamp_u8(buf[pix]);
-            let g = clamp_u8(buf[pix + 1]);
-            let b = clamp_u8(buf[pix + 2]);
-
-            buf[pix] = r as i16;
-            buf[pix + 1] = g as i16;
-            buf[pix + 2] = b as i16;
-
-            // LUT -> palette index
-            let li = lut_index_5bit(r, g, b);
-            let idx = lut_buf[li] as usize;
-            if idx >= k {
-                return Err(pyo3::exceptions::PyValueError::new_err("lut index out of palette bounds"));
-            }
-            out[y * width + xi] = idx as u8;
-
-            // chosen palette color
-            let pr = pal_i16[idx * 3];
-            let pg = pal_i16[idx * 3 + 1];
-            let pb = pal_i16[idx * 3 + 2];
-
-            // error /8 rounded
-            let er = div8_round(r as i16 - pr);
-            let eg = div8_round(g as i16 - pg);
-            let eb = div8_round(b as i16 - pb);
-
-            let x1 = x + dir;
-            let x2 = x + 2 * dir;
-            let y1 = y + 1;
-            let y2 = y + 2;
-
-            // (x+1, y)
-            if x1 >= 0 && (x1 as usize) < width {
-                let p = (y * width + x1 as usize) * 3;
-                buf[p] += er; buf[p + 1] += eg; buf[p + 2] += eb;
-            }
-            // (x+2, y)
-            if x2 >= 0 && (x2 as usize) < width {
-                let p = (y * width + x2 as usize) * 3;
-                buf[p] += er; buf[p + 1] += eg; buf[p + 2] += eb;
-            }
-
-            // next row
-            if y1 < height {
-                // (x-1, y+1)
-                let xm1 = x - dir;
-                if xm1 >= 0 && (xm1 as usize) < width {
-                    let p = (y1 * width + xm1 as usize) * 3;
-                    buf[p] += er; buf[p + 1] += eg; buf[p + 2] += eb;
-                }
-                // (x, y+1)
-                {
-                    let p = (y1 * width + xi) * 3;
-                    buf[p] += er; buf[p + 1] += eg; buf[p + 2] += eb;
-                }
-                // (x+1, y+1)
-                if x1 >= 0 && (x1 as usize) < width {
-                    let p = (y1 * width + x1 as usize) * 3;
-                    buf[p] += er; buf[p + 1] += eg; buf[p + 2] += eb;
-                }
-            }
-
-            // (x, y+2)
-            if y2 < height {
-                let p = (y2 * width + xi) * 3;
-                buf[p] += er; buf[p + 1] += eg; buf[p + 2] += eb;
-            }
-
-            x += dir;
-        }
+/// Dithers an image band by band, e.g. as horizontal strips come out of an
+/// earlier pipeline stage. The diffused error is carried from one band to the
+/// next, so the result is identical to dithering the whole image at once.
+#[pyclass]
+struct AtkinsonStream {
+    width: usize,
+    height: usize,
+    lut: Py<PyBytes>,
+    lut_bits: u32,
+    palette: Vec<i16>,
+    serpentine: bool,
+    threads: usize,
+    err: Vec<i16>,
+    /// First row of the next band
+    row: usize,
+}
+
+#[pymethods]
+impl AtkinsonStream {
+    #[new]
+    #[pyo3(signature = (width, height, lut, palette, serpentine, threads = 1))]
+    fn new(
+        width: usize,
+        height: usize,
+        lut: &Bound<'_, PyBytes>,
+        palette: &Bound<'_, PyBytes>,
+        serpentine: bool,
+        threads: usize,
+    ) -> PyResult<Self> {
+        let kernel = kernel(width, height, lut.as_bytes(), palette.as_bytes(), serpentine)?;
+        let err = kernel.error_rows();
+
+        Ok(Self {
+            width,
+            height,
+            lut_bits: kernel.lut_bits,
+            palette: kernel.palette,
+            lut: lut.clone().unbind(),
+            serpentine,
+            threads: resolve_threads(threads),
+            err,
+            row: 0,
+        })
     }
 
-    Ok(PyBytes::new(py, &out))
+    /// Rows dithered so far.
+    #[getter]
+    fn row(&self) -> usize {
+        self.row
+    }
+
+    /// Dither the next band: `rgb` holds whole rows as a C-contiguous uint8 buffer,
+    /// `out` receives width bytes per row. Returns the number of rows dithered.
+    /// The GIL is released while dithering.
+    fn feed(&mut self, py: Python<'_>, rgb: &Bound<'_, PyAny>, out: &Bound<'_, PyAny>) -> PyResult<usize> {
+        let rgb_buf: PyBuffer<u8> = PyBuffer::get(rgb)?;
+        let out_buf: PyBuffer<u8> = PyBuffer::get(out)?;
+
+        let row_bytes = self.width * 3;
+        if !rgb_buf.is_c_contiguous() || row_bytes == 0 || rgb_buf.item_count() % row_bytes != 0 {
+            return Err(PyValueError::new_err("rgb must be a C-contiguous uint8 buffer of whole rows"));
+        }
+        let rows = rgb_buf.item_count() / row_bytes;
+        let n = rows * self.width;
+
+        if self.row + rows > self.height {
+            return Err(PyValueError::new_err("band runs past the end of the image"));
+        }
+        if out_buf.readonly() || !out_buf.is_c_contiguous() || out_buf.item_count() != n {
+            return Err(PyValueError::new_err("out must be a writable C-contiguous uint8 buffer of width bytes per row"));
+        }
+
+        let rgb_start = rgb_buf.buf_ptr() as usize;
+        let out_start = out_buf.buf_ptr() as usize;
+        if rgb_start < out_start + n && out_start < rgb_start + n * 3 {
+            return Err(PyValueError::new_err("rgb and out must not overlap"));
+        }
+
+        let kernel = Kernel {
+            width: self.width,
+            height: self.height,
+            lut: self.lut.bind(py).as_bytes(),
+            lut_bits: self.lut_bits,
+            palette: self.palette.clone(),
+            serpentine: self.serpentine,
+        };
+        let err = &mut self.err;
+        let y0 = self.row;
+        let threads = self.threads;
+
+        py.detach(|| {
+            // SAFETY: both buffers were checked for size, contiguity and overlap above
+            let rgb = unsafe { std::slice::from_raw_parts(rgb_start as *const u8, n * 3) };
+            let out = unsafe { std::slice::from_raw_parts_mut(out_start as *mut u8, n) };
+            kernel.run_rows(rgb, out, err, y0, threads);
+        });
+
+        self.row += rows;
+        Ok(rows)
+    }
 }
 
 #[pymodule]
 fn atkinson_rs(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(atkinson_lut, m)?)?;
+    m.add_function(wrap_pyfunction!(atkinson_lut_into, m)?)?;
+    m.add_class::<AtkinsonStream>()?;
     Ok(())
 }
@@ -0,0 +1,241 @@
+"""
+Benchmarks every stage of the rendering pipeline separately.
+
+Each stage is timed on synthetic images at several resolutions and on any real
+images passed on the command line. Wall time is the median over all repeats.
+Peak memory (RSS growth during the stage) is measured in one extra run in a
+child process, since the sampling thread and allocator tuning it needs would
+otherwise skew the timings.
+
+Usage:
+    python benchmark.py [images...] [--repeat 3] [--output results.json]
+                        [--baseline baseline.json] [--threshold 0.15] [--min-delta 0.005]
+
+With --baseline the results are compared to an earlier --output file and the
+script exits with status 1 if any stage got slower than the threshold allows.
+
+There are no separate remap_to_driver and get_buffer stages, the pipeline no
+longer has them: pack_buffer remaps the dither indices to driver indices while
+it packs them, so its time covers both.
+"""
+import argparse
+import ctypes
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from benchmark_spi import NoopSpi
+from piframe.const import SPECTRA6_DITHER_PALETTE, DITHER_SERPENTINE, DITHER_THREADS, DITHER_TO_DRIVER
+from piframe.lib import epd13in3E, epdconfig
+from piframe.utils.akinson_dithering import atkinson_indices
+from piframe.utils.buffer_utils import pack_buffer
+from piframe.utils.image_utils import correct_image_orientation, resize_for_spectra6, enhance_colors
+from piframe.utils.source_image import SourceImage
+
+SYNTHETIC_SIZES = [(1200, 1600), (3000, 4000), (6000, 8000)]
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+M_MMAP_THRESHOLD = -3
+
+try:
+    libc = ctypes.CDLL("libc.so.6")
+except OSError:
+    libc = None
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+class PeakMemory:
+    """Samples RSS in a background thread and records the peak growth."""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.peak = 0
+
+    def __enter__(self):
+        if libc is not None:
+            libc.malloc_trim(0)
+        self._start = rss_bytes()
+        self._max = self._start
+        self._running = True
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._running = False
+        self._thread.join()
+        self._max = max(self._max, rss_bytes())
+        self.peak = self._max - self._start
+
+    def _sample(self):
+        while self._running:
+            self._max = max(self._max, rss_bytes())
+            time.sleep(self.interval)
+
+
+def synthetic_image(path: str, width: int, height: int):
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    noise = rng.integers(-30, 30, size=base.shape)
+    image = Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8), mode="RGB")
+    image.save(path, quality=90)
+
+
+def stages(screen: epd13in3E.EPD):
+    """(name, fn) pairs, each stage gets the output of the previous one."""
+    return [
+        ("load", lambda path: SourceImage.read(path)),
+        ("decode", lambda source: (source, source.open())),
+        ("correct_image_orientation", lambda s: correct_image_orientation(s[1], s[0].orientation)),
+        ("resize_for_spectra6", resize_for_spectra6),
+        ("enhance_colors", enhance_colors),
+        ("atkinson_dither", lambda image: atkinson_indices(image, SPECTRA6_DITHER_PALETTE,
+                                                           serpentine=DITHER_SERPENTINE,
+                                                           threads=DITHER_THREADS)),
+        ("pack_buffer", lambda indices: pack_buffer(indices, DITHER_TO_DRIVER)),
+        ("display", lambda buffer: screen.display(buffer).result()),
+    ]
+
+
+def time_pipeline(path: str, screen: epd13in3E.EPD) -> dict[str, float]:
+    results = {}
+    value = path
+    for name, fn in stages(screen):
+        start = time.perf_counter()
+        value = fn(value)
+        results[name] = time.perf_counter() - start
+    return results
+
+
+def measure_pipeline_memory(path: str) -> dict[str, int]:
+    # Runs in a child process. Serve every large allocation with its own mapping,
+    # so freed frames go back to the OS and each stage's peak shows up as RSS growth
+    if libc is not None:
+        libc.mallopt(M_MMAP_THRESHOLD, 128 * 1024)
+
+    # The display can't be pickled, the child opens its own
+    screen = simulated_screen()
+
+    results = {}
+    value = path
+    for name, fn in stages(screen):
+        with PeakMemory() as memory:
+            value = fn(value)
+        results[name] = memory.peak
+    return results
+
+
+def simulated_screen() -> epd13in3E.EPD:
+    epdconfig.spi = NoopSpi()
+    # Simulated display: no SPI clock and no refresh wait
+    epdconfig.delay_ms = lambda delaytime: None
+    return epd13in3E.EPD()
+
+
+def benchmark(paths: dict[str, str], repeat: int) -> dict:
+    screen = simulated_screen()
+
+    results = {}
+    for label, path in paths.items():
+        runs = [time_pipeline(path, screen) for _ in range(repeat)]
+        with multiprocessing.get_context("fork").Pool(1) as pool:
+            memory = pool.apply(measure_pipeline_memory, (path,))
+        results[label] = {
+            stage: {
+                "seconds": statistics.median(run[stage] for run in runs),
+                "peak_bytes": memory[stage],
+            }
+            for stage in memory
+        }
+        results[label]["total"] = {
+            "seconds": sum(stage["seconds"] for stage in results[label].values()),
+            "peak_bytes": max(stage["peak_bytes"] for stage in results[label].values()),
+        }
+        print_results(label, results[label])
+
+    return results
+
+
+def print_results(label: str, results: dict):
+    print(f"\n{label}")
+    for stage, result in results.items():
+        print(f"  {stage:<28} {result['seconds'] * 1000:9.1f} ms  {result['peak_bytes'] / 2 ** 20:8.1f} MB")
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta: float) -> list[str]:
+    regressions = []
+    for label, stages_ in results.items():
+        for stage, result in stages_.items():
+            old = baseline.get(label, {}).get(stage)
+            if old is None or old["seconds"] <= 0:
+                continue
+            change = result["seconds"] / old["seconds"] - 1
+            # Ignore jitter on stages that only take a few milliseconds
+            if change > threshold and result["seconds"] - old["seconds"] > min_delta:
+                regressions.append(
+                    f"{label} / {stage}: {old['seconds'] * 1000:.1f} ms -> {result['seconds'] * 1000:.1f} ms "
+                    f"({change:+.0%})"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PiFrame rendering pipeline")
+    parser.add_argument("images", nargs="*", help="real images to benchmark next to the synthetic ones")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against results from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative slowdown per stage")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="ignore slowdowns below this many seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for width, height in SYNTHETIC_SIZES:
+            path = os.path.join(tmp, f"synthetic_{width}x{height}.jpg")
+            synthetic_image(path, width, height)
+            paths[f"synthetic {width}x{height}"] = path
+        for path in args.images:
+            paths[os.path.basename(path)] = path
+
+        results = benchmark(paths, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "machine": platform.machine(),
+                "python": platform.python_version(),
+                "results": results,
+            }, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
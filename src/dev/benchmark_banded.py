@@ -0,0 +1,72 @@
+"""
+Compares the banded render (image_utils.render_bands, as used by
+pre_process_buffer) against the full frame pipeline it replaced, on time and
+peak memory, and checks that both give the same panel buffer.
+
+Peak memory is the RSS growth during the render, measured in a fresh child
+process per run, since PIL's allocations are invisible to tracemalloc.
+
+Usage: python benchmark_banded.py [image_path]
+Without an image a synthetic 4000x3000 JPEG is used.
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmark_enhance import synthetic_image
+from piframe.utils.akinson_dithering import warm_lut
+from piframe.utils.buffer_utils import pack_buffer
+from piframe.utils.image_utils import load_source, pre_process_buffer, pre_process_image
+
+
+def full_frame(source):
+    # What EPD.get_buffer does with the driver palette image
+    return pack_buffer(np.asarray(pre_process_image(source), dtype=np.uint8))
+
+
+def _measure(fn, path, queue):
+    source = load_source(path)
+    # Load the LUT up front, so its one-off cost does not count
+    warm_lut()
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    buffer = fn(source)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+
+    queue.put((buffer, elapsed, peak * 1024))
+
+
+def measured(fn, path):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure, args=(fn, path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "synthetic.jpg")
+        synthetic_image(4000, 3000).save(path, quality=92)
+
+    old, old_time, old_peak = measured(full_frame, path)
+    new, new_time, new_peak = measured(pre_process_buffer, path)
+
+    print(f"Image:       {path}")
+    print(f"{'':12} {'time':>9} {'peak':>10}")
+    print(f"{'Full frame':12} {old_time:8.3f}s {old_peak / 2 ** 20:8.1f}MB")
+    print(f"{'Banded':12} {new_time:8.3f}s {new_peak / 2 ** 20:8.1f}MB")
+    print(f"Identical:   {old == new}")
+
+    if old != new:
+        sys.exit(1)
@@ -0,0 +1,83 @@
+"""
+Compares the vectorized enhance_colors against the original per-pixel implementation.
+
+Usage: python benchmark_enhance.py [image_path]
+Without an image a synthetic 1200x1600 frame is used.
+"""
+import colorsys
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from piframe.const import CONTRAST_FACTOR, VIBRANCE_AMOUNT, GAMMA, DISPLAY_WIDTH, DISPLAY_HEIGHT
+from piframe.utils.image_utils import enhance_colors, apply_gamma
+
+# Maximum allowed per-channel difference with the legacy implementation
+TOLERANCE = 1
+
+
+def legacy_apply_vibrance(img, *, amount=0.25, max_s=0.65, highlight_protect=0.20):
+    img = img.convert("RGB")
+    px = img.load()
+    w, h = img.size
+
+    for y in range(h):
+        for x in range(w):
+            r, g, b = px[x, y]
+            rf, gf, bf = r / 255.0, g / 255.0, b / 255.0
+            h_, l_, s_ = colorsys.rgb_to_hls(rf, gf, bf)
+
+            if s_ < max_s:
+                boost = (1.0 - s_) * amount
+                boost *= (1.0 - highlight_protect * l_)
+                s2 = min(1.0, s_ + boost)
+                r2, g2, b2 = colorsys.hls_to_rgb(h_, l_, s2)
+                px[x, y] = (int(r2 * 255), int(g2 * 255), int(b2 * 255))
+
+    return img
+
+
+def legacy_enhance_colors(image):
+    img = image.convert("RGB")
+    img = ImageEnhance.Contrast(img).enhance(CONTRAST_FACTOR)
+    img = legacy_apply_vibrance(img, amount=VIBRANCE_AMOUNT)
+    img = apply_gamma(img, gamma=GAMMA)
+    return img
+
+
+def synthetic_image(width, height):
+    rng = np.random.default_rng(0)
+    # Smooth gradients plus noise, covers grays, saturated colors and clipping
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    noise = rng.integers(-40, 40, size=base.shape)
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8), mode="RGB")
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        image = Image.open(sys.argv[1]).convert("RGB").resize((DISPLAY_WIDTH, DISPLAY_HEIGHT))
+    else:
+        image = synthetic_image(DISPLAY_WIDTH, DISPLAY_HEIGHT)
+
+    new, new_time = timed(enhance_colors, image)
+    old, old_time = timed(legacy_enhance_colors, image)
+
+    diff = np.abs(np.asarray(new, dtype=np.int16) - np.asarray(old, dtype=np.int16))
+    print(f"Image size:      {image.width}x{image.height}")
+    print(f"Legacy:          {old_time:.3f}s")
+    print(f"Vectorized:      {new_time:.3f}s")
+    print(f"Speedup:         {old_time / new_time:.1f}x")
+    print(f"Max difference:  {diff.max()} (tolerance {TOLERANCE})")
+    print(f"Pixels differing: {np.count_nonzero(diff.any(axis=-1))}")
+
+    if diff.max() > TOLERANCE:
+        sys.exit(1)
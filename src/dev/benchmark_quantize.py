@@ -0,0 +1,80 @@
+"""
+Compares the chunked quantize_lab_nearest (with and without the Lab LUT)
+against the original full frame implementation, on time and peak memory.
+
+Peak memory is what NumPy allocates during the call, as traced by tracemalloc.
+
+Usage: python benchmark_quantize.py [image_path]
+Without an image a synthetic 1200x1600 frame is used.
+"""
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+from skimage.color import rgb2lab
+
+from benchmark_enhance import synthetic_image
+from piframe.const import DISPLAY_WIDTH, DISPLAY_HEIGHT, SPECTRA6_DITHER_PALETTE
+from piframe.utils.color_mapping_utils import quantize_lab_nearest, _palette_rgb_to_lab
+
+
+def legacy_quantize_lab_nearest(img_rgb, palette_flat):
+    rgb = np.array(img_rgb.convert("RGB"), dtype=np.uint8)
+    h, w, _ = rgb.shape
+
+    palette_rgb = np.array([palette_flat[i:i+3] for i in range(0, len(palette_flat), 3)], dtype=np.uint8)
+    k = palette_rgb.shape[0]
+    pal_lab = _palette_rgb_to_lab(palette_rgb)
+
+    lab = rgb2lab(rgb.astype(np.float32) / 255.0).astype(np.float32)
+
+    d2 = np.empty((h, w, k), dtype=np.float32)
+    for i in range(k):
+        dl = lab[:, :, 0] - pal_lab[i, 0]
+        da = lab[:, :, 1] - pal_lab[i, 1]
+        db = lab[:, :, 2] - pal_lab[i, 2]
+        d2[:, :, i] = dl*dl + da*da + db*db
+
+    idx = np.argmin(d2, axis=2).astype(np.uint8)
+
+    out = Image.fromarray(idx, mode="P")
+    out.putpalette(list(palette_flat) + [0, 0, 0] * (256 - k))
+    return out
+
+
+def measured(fn, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        image = Image.open(sys.argv[1]).convert("RGB").resize((DISPLAY_WIDTH, DISPLAY_HEIGHT))
+    else:
+        image = synthetic_image(DISPLAY_WIDTH, DISPLAY_HEIGHT)
+
+    palette = SPECTRA6_DITHER_PALETTE
+    # Load (or build) the LUT up front, so its one-off cost does not count
+    quantize_lab_nearest(image.crop((0, 0, 1, 1)), palette, use_lut=True)
+
+    old, old_time, old_peak = measured(legacy_quantize_lab_nearest, image, palette)
+    print(f"Image size:  {image.width}x{image.height}")
+    print(f"{'':12} {'time':>9} {'peak':>10}  identical")
+    print(f"{'Legacy':12} {old_time:8.3f}s {old_peak / 2 ** 20:8.1f}MB")
+
+    failed = False
+    for label, kwargs in (("Chunked", {}), ("Lab LUT", {"use_lut": True})):
+        new, new_time, new_peak = measured(quantize_lab_nearest, image, palette, **kwargs)
+        identical = np.array_equal(np.asarray(new), np.asarray(old))
+        failed |= not identical
+        print(f"{label:12} {new_time:8.3f}s {new_peak / 2 ** 20:8.1f}MB  {identical}")
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,95 @@
+"""
+Times the host side of a full frame SPI transfer, old per-row list path vs the
+bulk buffer path. The driver library is replaced by a no-op, so the numbers
+show the Python/ctypes overhead that is added on top of the actual SPI clock.
+
+Usage: python benchmark_spi.py
+"""
+import os
+import time
+from unittest import mock
+
+import numpy as np
+
+# The driver libraries are ARM builds, skip loading them off the Pi
+if not os.uname().machine.startswith(("arm", "aarch64")):
+    with mock.patch("ctypes.CDLL"):
+        from piframe.lib import epdconfig
+
+from piframe.lib import epd13in3E, epdconfig
+from piframe.utils.buffer_utils import pack_buffer
+
+
+class NoopSpi:
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+
+    def DEV_SPI_SendData_nByte(self, data, length):
+        self.calls += 1
+        self.bytes += length.value
+
+    def DEV_SPI_SendData(self, value):
+        pass
+
+    def DEV_Digital_Write(self, pin, value):
+        pass
+
+    def DEV_Digital_Read(self, pin):
+        return 1
+
+
+def legacy_display_transfer(screen, image):
+    Width = int(screen.width / 4)
+    Width1 = int(screen.width / 2)
+    for i in range(screen.height):
+        screen.SendData2(image[i * Width1: i * Width1 + Width], Width)
+    for i in range(screen.height):
+        screen.SendData2(image[i * Width1 + Width: i * Width1 + Width1], Width)
+
+
+def legacy_clear_transfer(screen, color=0x11):
+    for _ in range(2):
+        for i in range(screen.height):
+            screen.SendData2([color] * int(screen.width / 2), int(screen.width / 2))
+
+
+def display_transfer(screen, buffer):
+    master, slave = epd13in3E.split_buffer(buffer)
+    screen.SendBuffer(master)
+    screen.SendBuffer(slave)
+
+
+def clear_transfer(screen, color=0x11):
+    fill = epd13in3E._fill_buffer(color, screen.height * int(screen.width / 2))
+    screen.SendBuffer(fill)
+    screen.SendBuffer(fill)
+
+
+def timed(spi, fn, *args):
+    spi.calls = spi.bytes = 0
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start, spi.calls, spi.bytes
+
+
+if __name__ == "__main__":
+    spi = NoopSpi()
+    epdconfig.spi = spi
+    screen = epd13in3E.EPD()
+
+    indices = np.random.default_rng(0).choice(np.array([0, 1, 2, 3, 5, 6], dtype=np.uint8),
+                                              size=(screen.height, screen.width))
+    packed = pack_buffer(indices)
+    # Legacy get_buffer produced a list in row order
+    legacy = list(np.frombuffer(packed, dtype=np.uint8).reshape(2, screen.height, -1).transpose(1, 0, 2).ravel())
+
+    results = [
+        ("display, per-row lists", timed(spi, legacy_display_transfer, screen, legacy)),
+        ("display, bulk buffer", timed(spi, display_transfer, screen, packed)),
+        ("clear, per-row lists", timed(spi, legacy_clear_transfer, screen)),
+        ("clear, cached fill", timed(spi, clear_transfer, screen)),
+    ]
+
+    for name, (seconds, calls, nbytes) in results:
+        print(f"{name:<24} {seconds * 1000:8.1f} ms  {calls:5d} calls  {nbytes} bytes")
@@ -1,34 +1,18 @@
-import sys
-from types import ModuleType
-
-from PIL import Image
-
-# Create a dummy 'epdconfig' module
-epdconfig = ModuleType("epdconfig")
-epdconfig.EPD_SCK_PIN = 11
-epdconfig.EPD_MOSI_PIN = 10
-epdconfig.EPD_CS_M_PIN = 8
-epdconfig.EPD_CS_S_PIN = 7
-epdconfig.EPD_DC_PIN = 25
-epdconfig.EPD_RST_PIN = 17
-epdconfig.EPD_BUSY_PIN = 24
-epdconfig.EPD_PWR_PIN = 18
-sys.modules["piframe.lib.epdconfig"] = epdconfig
-
 from piframe.lib import epd13in3E
-from piframe.utils.image_utils import pre_process_image
+from piframe.lib.epd_simulator import SimulatedBackend
+from piframe.utils.image_utils import load_source, pre_process_buffer
 
 test_image_name = "test_2.JPEG"
 
-# Open image
-disk_image = Image.open(test_image_name)
-image = disk_image.copy()
-disk_image.close()
+# Read image
+source = load_source("./" + test_image_name)
+
+# Process image to buffer and draw it on a simulated panel, without delays
+backend = SimulatedBackend(time_scale=0)
+screen = epd13in3E.EPD(backend)
+screen.Init()
+buffer = pre_process_buffer(source)
+screen.display(buffer).result()
+screen.sleep()
 
-# Process image to buffer
-screen = epd13in3E.EPD()
-image = pre_process_image(image, "./" + test_image_name)
-print(image.mode, min(image.getdata()), max(image.getdata()))
-screen.get_buffer(image)
-image.show()
-print('')
+print(f"{backend.bytes_sent} bytes sent, frame written to {backend.directory}")
@@ -7,12 +7,87 @@ ROOT_DIR = os.getcwd()
 ASSETS_DIR = os.path.join(ROOT_DIR, "assets")
 FONTS_DIR = os.path.join(ASSETS_DIR, "fonts")
 IMAGES_DIR = os.path.abspath('/mnt/frame-images')
+CACHE_DIR = os.path.join(ROOT_DIR, "cache")
+RENDER_CACHE_DIR = os.path.join(CACHE_DIR, "renders")
+IMAGE_INDEX_PATH = os.path.join(CACHE_DIR, "library.sqlite")
+GEOCODE_CACHE_PATH = os.path.join(CACHE_DIR, "geocode.sqlite")
+LUT_CACHE_DIR = os.path.join(CACHE_DIR, "luts")
+# Packed buffer of the frame on the panel, redrawn as is after a restart
+LAST_FRAME_PATH = os.path.join(CACHE_DIR, "last_frame.bin")
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tiff"}
+
+# Reverse geocoding
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/reverse"
+# Nominatim usage policy allows at most one request per second
+NOMINATIM_MIN_INTERVAL_SECONDS = 1.0
+# Coordinates are rounded to 4 decimals (~11m) before lookup
+GEOCODE_PRECISION = 4
+GEOCODE_TTL_SECONDS = 90 * 24 * 60 * 60
+GEOCODE_CACHE_MAX_ENTRIES = 20000
+# Failed lookups are not retried for this long, so renders don't wait on an unreachable server
+GEOCODE_FAILURE_TTL_SECONDS = 5 * 60
+
+# Upper bound for the on-disk render cache, least recently shown frames are evicted first
+RENDER_CACHE_MAX_BYTES = 512 * 1024 * 1024
 
 DISPLAY_WIDTH = 1200
 DISPLAY_HEIGHT = 1600
 
 IMAGE_DELAY_SECONDS = 1200
 
+# Busy pin polling while the panel works: the interval starts at the minimum
+# and doubles up to the maximum, which bounds how late the end of a refresh is noticed
+BUSY_POLL_MIN_MS = 1
+BUSY_POLL_MAX_MS = 100
+
+# Panel backend: "spi" drives the real panel, "simulator" imitates it (see
+# lib/epd_simulator.py), writing every refreshed frame to SIMULATOR_DIR.
+# The simulator's delays are scaled by the time scale, 0 skips them.
+EPD_BACKEND = os.environ.get("PIFRAME_EPD_BACKEND", "spi")
+SIMULATOR_DIR = os.path.join(CACHE_DIR, "simulator")
+SIMULATOR_TIME_SCALE = float(os.environ.get("PIFRAME_SIMULATOR_TIME_SCALE", "1.0"))
+
+# Uploads: size limit per file, files and bytes per request, images processed
+# at once and at most waiting or in progress
+UPLOAD_MAX_BYTES = 64 * 1024 * 1024
+UPLOAD_MAX_FILES = 16
+UPLOAD_MAX_REQUEST_BYTES = 256 * 1024 * 1024
+INGEST_WORKERS = 1
+INGEST_MAX_PENDING = 32
+
+# Number of upcoming images rendered ahead of time
+PREFETCH_DEPTH = 2
+
+# Resize first shrinks by an integer factor with a box filter, as long as the
+# remaining LANCZOS step still covers at least this factor
+RESIZE_REDUCING_GAP = 3.0
+
+# Color enhancement and dithering parameters
+CONTRAST_FACTOR = 1.05
+VIBRANCE_AMOUNT = 0.05
+GAMMA = 1.13
+# Serpentine scanning cannot be dithered in parallel: a reversed row starts at
+# the pixel the row above finishes last. Setting it to False lets
+# DITHER_THREADS apply, at the cost of slightly different (left to right)
+# error diffusion in every frame and a re-render of all cached frames.
+DITHER_SERPENTINE = True
+# Dithering threads, 0 uses every core. Ignored with DITHER_SERPENTINE, which
+# always uses a single thread.
+DITHER_THREADS = 0
+# Palette lookup table: grid bits per channel (5-8) and color distance ("rgb" or "lab")
+DITHER_LUT_BITS = 7
+DITHER_LUT_METRIC = "lab"
+
+# Rendering works on horizontal bands after the resize. Together with the
+# source and its decode, its peak memory stays below the ceiling, sources that
+# would not fit are decoded at a reduced size
+RENDER_BAND_ROWS = 64
+RENDER_MEMORY_CEILING = 96 * 1024 * 1024
+
+# Working memory budget of quantize_lab_nearest, on top of the image itself
+QUANTIZE_MAX_BYTES = 8 * 1024 * 1024
+
 # Dither palette mapping to driver/spectra6 palette
 DITHER_TO_DRIVER = np.array([0, 1, 2, 3, 5, 6], dtype=np.uint8)
 
@@ -28,15 +28,29 @@
 #
 import logging
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 
-from piframe.const import DISPLAY_WIDTH, DISPLAY_HEIGHT
-from piframe.lib import epdconfig
+import numpy as np
+
+from piframe.const import DISPLAY_WIDTH, DISPLAY_HEIGHT, BUSY_POLL_MIN_MS, BUSY_POLL_MAX_MS
+from piframe.lib.epd_backend import Backend, get_backend
+from piframe.utils.buffer_utils import pack_buffer, split_buffer
+from piframe.utils.metrics import STAGE_SECONDS, FRAMES_DISPLAYED, BUSY_POLLS
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1)
+def _fill_buffer(color, length):
+    return bytes([color]) * length
+
+
 class EPD():
-    def __init__(self):
+    def __init__(self, backend: Backend | None = None):
+        # Real SPI panel or simulator, see EPD_BACKEND
+        self.backend = backend if backend is not None else get_backend()
+
         self.width = DISPLAY_WIDTH
         self.height = DISPLAY_HEIGHT
 
@@ -47,60 +61,81 @@ class EPD():
         self.BLUE = 0xff0000  # 0101
         self.GREEN = 0x00ff00  # 0110
 
-        self.EPD_CS_M_PIN = epdconfig.EPD_CS_M_PIN
-        self.EPD_CS_S_PIN = epdconfig.EPD_CS_S_PIN
+        self.EPD_CS_M_PIN = self.backend.EPD_CS_M_PIN
+        self.EPD_CS_S_PIN = self.backend.EPD_CS_S_PIN
+
+        self.EPD_DC_PIN = self.backend.EPD_DC_PIN
+        self.EPD_RST_PIN = self.backend.EPD_RST_PIN
+        self.EPD_BUSY_PIN = self.backend.EPD_BUSY_PIN
+        self.EPD_PWR_PIN = self.backend.EPD_PWR_PIN
 
-        self.EPD_DC_PIN = epdconfig.EPD_DC_PIN
-        self.EPD_RST_PIN = epdconfig.EPD_RST_PIN
-        self.EPD_BUSY_PIN = epdconfig.EPD_BUSY_PIN
-        self.EPD_PWR_PIN = epdconfig.EPD_PWR_PIN
+        # Every panel operation runs on this thread, in the order it was submitted
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="epd")
 
     def Reset(self):
-        epdconfig.digital_write(self.EPD_RST_PIN, 1)
+        self.backend.digital_write(self.EPD_RST_PIN, 1)
         time.sleep(0.03)
-        epdconfig.digital_write(self.EPD_RST_PIN, 0)
+        self.backend.digital_write(self.EPD_RST_PIN, 0)
         time.sleep(0.03)
-        epdconfig.digital_write(self.EPD_RST_PIN, 1)
+        self.backend.digital_write(self.EPD_RST_PIN, 1)
         time.sleep(0.03)
-        epdconfig.digital_write(self.EPD_RST_PIN, 0)
+        self.backend.digital_write(self.EPD_RST_PIN, 0)
         time.sleep(0.03)
-        epdconfig.digital_write(self.EPD_RST_PIN, 1)
+        self.backend.digital_write(self.EPD_RST_PIN, 1)
         time.sleep(0.03)
 
     def CS_ALL(self, Value):
-        epdconfig.digital_write(self.EPD_CS_M_PIN, Value)
-        epdconfig.digital_write(self.EPD_CS_S_PIN, Value)
+        self.backend.digital_write(self.EPD_CS_M_PIN, Value)
+        self.backend.digital_write(self.EPD_CS_S_PIN, Value)
 
     def SendCommand(self, Command):
-        epdconfig.spi_writebyte(Command)
+        self.backend.spi_writebyte(Command)
 
     def SendData(self, Data):
-        epdconfig.spi_writebyte(Data)
+        self.backend.spi_writebyte(Data)
 
     def SendData2(self, buf, Len):
-        epdconfig.spi_writebyte2(buf, Len)
+        self.backend.spi_writebyte2(buf, Len)
+
+    def SendBuffer(self, buf):
+        self.backend.spi_writebuffer(buf)
 
     def ReadBusyH(self):
+        """
+        Wait until the panel is idle, returns the seconds spent waiting.
+
+        The poll interval starts at BUSY_POLL_MIN_MS and doubles up to
+        BUSY_POLL_MAX_MS, so short waits end quickly and a refresh of tens of
+        seconds only takes a few hundred polls.
+        """
         logger.debug("e-Paper busy, waiting...")
-        while (epdconfig.digital_read(self.EPD_BUSY_PIN) == 0):  # 0: busy, 1: idle
-            epdconfig.delay_ms(5)
+        start = time.perf_counter()
+        delay = BUSY_POLL_MIN_MS
+        polls = 0
+        with STAGE_SECONDS.time("busy_wait"):
+            while (self.backend.digital_read(self.EPD_BUSY_PIN) == 0):  # 0: busy, 1: idle
+                polls += 1
+                self.backend.delay_ms(delay)
+                delay = min(delay * 2, BUSY_POLL_MAX_MS)
+        BUSY_POLLS.inc(amount=polls)
         logger.debug("e-Paper ready")
+        return time.perf_counter() - start
 
     def TurnOnDisplay(self):
         logger.debug("Powering display on (PON)")
         self.CS_ALL(0)
         self.SendCommand(0x04)
         self.CS_ALL(1)
-        self.ReadBusyH()
+        busy = self.ReadBusyH()
 
-        epdconfig.delay_ms(50)
+        self.backend.delay_ms(50)
 
         logger.debug("Writing to display (DRF)")
         self.CS_ALL(0)
         self.SendCommand(0x12)
         self.SendData(0x00)
         self.CS_ALL(1)
-        self.ReadBusyH()
+        busy += self.ReadBusyH()
 
         logger.debug("Turning display off (POF)")
         self.CS_ALL(0)
@@ -108,15 +143,21 @@ class EPD():
         self.SendData(0x00)
         self.CS_ALL(1)
         logger.debug("Finished drawing")
+        return busy
+
+    def wait(self):
+        """Block until every submitted panel operation is done."""
+        self._executor.submit(lambda: None).result()
 
     def Init(self):
+        self.wait()
         logger.debug("Initializing display")
-        epdconfig.module_init()
+        self.backend.module_init()
 
         self.Reset()
         self.ReadBusyH()
 
-        epdconfig.digital_write(self.EPD_CS_M_PIN, 0)
+        self.backend.digital_write(self.EPD_CS_M_PIN, 0)
         self.SendCommand(0x74)
         self.SendData(0xC0)
         self.SendData(0x1C)
@@ -179,7 +220,7 @@ class EPD():
         self.SendData(0x20)
         self.CS_ALL(1)
 
-        epdconfig.digital_write(self.EPD_CS_M_PIN, 0)
+        self.backend.digital_write(self.EPD_CS_M_PIN, 0)
         self.SendCommand(0x01)
         self.SendData(0x0F)
         self.SendData(0x00)
@@ -189,87 +230,112 @@ class EPD():
         self.SendData(0x38)
         self.CS_ALL(1)
 
-        epdconfig.digital_write(self.EPD_CS_M_PIN, 0)
+        self.backend.digital_write(self.EPD_CS_M_PIN, 0)
         self.SendCommand(0xB6)
         self.SendData(0x07)
         self.CS_ALL(1)
 
-        epdconfig.digital_write(self.EPD_CS_M_PIN, 0)
+        self.backend.digital_write(self.EPD_CS_M_PIN, 0)
         self.SendCommand(0x06)
         self.SendData(0xE8)
         self.SendData(0x28)
         self.CS_ALL(1)
 
-        epdconfig.digital_write(self.EPD_CS_M_PIN, 0)
+        self.backend.digital_write(self.EPD_CS_M_PIN, 0)
         self.SendCommand(0xB7)
         self.SendData(0x01)
         self.CS_ALL(1)
 
-        epdconfig.digital_write(self.EPD_CS_M_PIN, 0)
+        self.backend.digital_write(self.EPD_CS_M_PIN, 0)
         self.SendCommand(0x05)
         self.SendData(0xE8)
         self.SendData(0x28)
         self.CS_ALL(1)
 
-        epdconfig.digital_write(self.EPD_CS_M_PIN, 0)
+        self.backend.digital_write(self.EPD_CS_M_PIN, 0)
         self.SendCommand(0xB0)
         self.SendData(0x01)
         self.CS_ALL(1)
 
-        epdconfig.digital_write(self.EPD_CS_M_PIN, 0)
+        self.backend.digital_write(self.EPD_CS_M_PIN, 0)
         self.SendCommand(0xB1)
         self.SendData(0x02)
         self.CS_ALL(1)
 
     def get_buffer(self, image):
-        buf_7color = bytearray(image.tobytes())
+        with STAGE_SECONDS.time("pack"):
+            return pack_buffer(np.asarray(image, dtype=np.uint8))
 
-        buf = [0x00] * (self.width * self.height // 2)
-        idx = 0
-        for i in range(0, len(buf_7color), 2):
-            buf[idx] = (buf_7color[i] << 4) + buf_7color[i + 1]
-            idx += 1
+    def Clear(self, color=0x11) -> Future:
+        """Fill the panel with one color, see display() for the returned future."""
+        return self._executor.submit(self._clear, color)
 
-        return buf
+    def _clear(self, color):
+        fill = _fill_buffer(color, self.height * int(self.width / 2))
 
-    def Clear(self, color=0x11):
-        epdconfig.digital_write(self.EPD_CS_M_PIN, 0)
-        self.SendCommand(0x10)
-        for i in range(self.height):
-            self.SendData2([color] * int(self.width / 2), int(self.width / 2))
-        self.CS_ALL(1)
-        epdconfig.digital_write(self.EPD_CS_S_PIN, 0)
+        self.backend.digital_write(self.EPD_CS_M_PIN, 0)
         self.SendCommand(0x10)
-        for i in range(self.height):
-            self.SendData2([color] * int(self.width / 2), int(self.width / 2))
+        self.SendBuffer(fill)
         self.CS_ALL(1)
-
-        self.TurnOnDisplay()
-
-    def display(self, image):
-        Width = int(self.width / 4)
-        Width1 = int(self.width / 2)
-
-        epdconfig.digital_write(self.EPD_CS_M_PIN, 0)
-        self.SendCommand(0x10)
-        for i in range(self.height):
-            self.SendData2(image[i * Width1: i * Width1 + Width], Width)
-        self.CS_ALL(1)
-
-        epdconfig.digital_write(self.EPD_CS_S_PIN, 0)
+        self.backend.digital_write(self.EPD_CS_S_PIN, 0)
         self.SendCommand(0x10)
-        for i in range(self.height):
-            self.SendData2(image[i * Width1 + Width: i * Width1 + Width1], Width)
+        self.SendBuffer(fill)
         self.CS_ALL(1)
 
-        self.TurnOnDisplay()
+        return self.TurnOnDisplay()
+
+    def display(self, image) -> Future:
+        """
+        Send a packed frame and refresh the panel, without blocking.
+
+        The transfer and refresh run on the panel thread, the buffer must stay
+        valid until they are done. The returned future resolves to the seconds
+        the panel was busy refreshing.
+        """
+        return self._executor.submit(self._display_bands, [split_buffer(image)])
+
+    def display_bands(self, bands) -> Future:
+        """
+        Like display(), for a frame given as (master, slave) parts in order from
+        the top, e.g. straight from image_utils.render_bands. The parts are
+        consumed on the panel thread, master parts go out as they arrive and
+        the slave parts are kept until the master half is done.
+        """
+        return self._executor.submit(self._display_bands, bands)
+
+    def _display_bands(self, bands):
+        slave_parts = []
+
+        with STAGE_SECONDS.time("spi_transfer"):
+            # A band that fails to render raises here, chip select must not stay low
+            try:
+                self.backend.digital_write(self.EPD_CS_M_PIN, 0)
+                self.SendCommand(0x10)
+                for master, slave in bands:
+                    self.SendBuffer(master)
+                    slave_parts.append(slave)
+            finally:
+                self.CS_ALL(1)
+
+            try:
+                self.backend.digital_write(self.EPD_CS_S_PIN, 0)
+                self.SendCommand(0x10)
+                for slave in slave_parts:
+                    self.SendBuffer(slave)
+            finally:
+                self.CS_ALL(1)
+
+        busy = self.TurnOnDisplay()
+        FRAMES_DISPLAYED.inc()
+        return busy
 
     def sleep(self):
+        self.wait()
         self.CS_ALL(0)
         self.SendCommand(0x07)
         self.SendData(0XA5)
         self.CS_ALL(1)
 
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        self.backend.delay_ms(2000)
+        self.backend.module_exit()
 ### END OF FILE ###
@@ -0,0 +1,46 @@
+from typing import Protocol
+
+from piframe.const import EPD_BACKEND
+
+
+class Backend(Protocol):
+    """
+    Hardware access used by epd13in3E.EPD: GPIO pins, the SPI bus and delays.
+
+    The epdconfig module is the real implementation, on top of the Waveshare
+    DEV_Config library. epd_simulator.SimulatedBackend imitates the panel.
+    """
+
+    EPD_CS_M_PIN: int
+    EPD_CS_S_PIN: int
+    EPD_DC_PIN: int
+    EPD_RST_PIN: int
+    EPD_BUSY_PIN: int
+    EPD_PWR_PIN: int
+
+    def digital_write(self, pin: int, value: int): ...
+
+    def digital_read(self, pin: int) -> int: ...
+
+    def spi_writebyte(self, value: int): ...
+
+    def spi_writebyte2(self, buf, len: int): ...
+
+    def spi_writebuffer(self, buf): ...
+
+    def delay_ms(self, delaytime: float): ...
+
+    def module_init(self): ...
+
+    def module_exit(self): ...
+
+
+def get_backend(name: str = EPD_BACKEND) -> Backend:
+    """Return the backend configured by EPD_BACKEND (PIFRAME_EPD_BACKEND): "spi" or "simulator"."""
+    if name == "spi":
+        from piframe.lib import epdconfig
+        return epdconfig
+    if name == "simulator":
+        from piframe.lib.epd_simulator import SimulatedBackend
+        return SimulatedBackend()
+    raise ValueError(f"Unknown EPD backend {name!r}, expected 'spi' or 'simulator'")
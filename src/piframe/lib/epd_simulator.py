@@ -0,0 +1,199 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from piframe.const import DISPLAY_WIDTH, DISPLAY_HEIGHT, SIMULATOR_DIR, SIMULATOR_TIME_SCALE
+from piframe.lib import epdconfig
+from piframe.utils.buffer_utils import buffer_to_image
+
+logger = logging.getLogger(__name__)
+
+# Rough timings of the 13.3" Spectra 6 panel, in seconds
+SPI_HZ = 10_000_000
+RESET_SECONDS = 0.05
+POWER_ON_SECONDS = 0.2
+REFRESH_SECONDS = 19.0
+POWER_OFF_SECONDS = 0.1
+
+# Busy time per command
+COMMAND_BUSY_SECONDS = {
+    0x04: POWER_ON_SECONDS,  # PON
+    0x12: REFRESH_SECONDS,  # DRF
+    0x02: POWER_OFF_SECONDS,  # POF
+}
+
+DATA_START_TRANSMISSION = 0x10
+DISPLAY_REFRESH = 0x12
+DEEP_SLEEP = 0x07
+
+# Bytes of frame RAM per controller, each drives half of every row
+HALF_FRAME_BYTES = DISPLAY_WIDTH * DISPLAY_HEIGHT // 4
+
+
+@dataclass(eq=False)
+class Transfer:
+    """One chip select cycle: the command and the data bytes that followed it."""
+    chips: tuple[str, ...]
+    command: int | None
+    length: int
+
+
+class SimulatedBackend:
+    """
+    Stands in for epdconfig, so the driver and the whole service run without
+    the panel or the DEV_Config library.
+
+    SPI traffic is decoded per chip select cycle like the two controllers
+    would: the first byte is the command, the rest its data. Cycles are kept
+    in `transfers` (the most recent ones) and counted in `bytes_sent`. Data
+    for DTM (0x10) fills each controller's frame RAM, and on every refresh
+    (DRF, 0x12) the panel contents are decoded and written to
+    `directory`/frame.png.
+
+    The busy pin follows a timing model: low for a while after a reset, power
+    on, refresh and power off. SPI transfers take as long as they would at
+    SPI_HZ. All delays are multiplied by `time_scale`, 0 makes everything
+    instant.
+    """
+
+    EPD_SCK_PIN = epdconfig.EPD_SCK_PIN
+    EPD_MOSI_PIN = epdconfig.EPD_MOSI_PIN
+    EPD_CS_M_PIN = epdconfig.EPD_CS_M_PIN
+    EPD_CS_S_PIN = epdconfig.EPD_CS_S_PIN
+    EPD_DC_PIN = epdconfig.EPD_DC_PIN
+    EPD_RST_PIN = epdconfig.EPD_RST_PIN
+    EPD_BUSY_PIN = epdconfig.EPD_BUSY_PIN
+    EPD_PWR_PIN = epdconfig.EPD_PWR_PIN
+
+    def __init__(self, directory: str = SIMULATOR_DIR, *, time_scale: float = SIMULATOR_TIME_SCALE,
+                 save_frames: bool = True, history: int = 1024):
+        self.directory = directory
+        self.time_scale = time_scale
+        self.save_frames = save_frames
+
+        self.transfers: deque[Transfer] = deque(maxlen=history)
+        self.bytes_sent = 0
+        self.refreshes = 0
+        self.initialized = False
+        self.asleep = False
+
+        self._pins = {self.EPD_CS_M_PIN: 1, self.EPD_CS_S_PIN: 1, self.EPD_BUSY_PIN: 1}
+        self._chips = {self.EPD_CS_M_PIN: "master", self.EPD_CS_S_PIN: "slave"}
+        # Selected chips and their cycle, None until the command byte arrives
+        self._current: dict[str, Transfer | None] = {}
+        self._ram = {"master": bytearray(HALF_FRAME_BYTES), "slave": bytearray(HALF_FRAME_BYTES)}
+        self._busy_until = 0.0
+        self._lock = threading.Lock()
+
+    # GPIO
+
+    def digital_write(self, pin, value):
+        with self._lock:
+            previous = self._pins.get(pin)
+            self._pins[pin] = value
+
+            chip = self._chips.get(pin)
+            if chip is not None and value != previous:
+                if value == 0:
+                    self._current[chip] = None
+                else:
+                    self._end_transfer(chip)
+            elif pin == self.EPD_RST_PIN and previous == 0 and value == 1:
+                self._set_busy(RESET_SECONDS)
+
+    def digital_read(self, pin):
+        if pin == self.EPD_BUSY_PIN:
+            return 0 if time.monotonic() < self._busy_until else 1
+        return self._pins.get(pin, 0)
+
+    # SPI
+
+    def spi_writebyte(self, value):
+        self._write(bytes((value,)))
+
+    def spi_writebyte2(self, buf, len):
+        self._write(bytes(buf[:len]))
+
+    def spi_writebuffer(self, buf):
+        self._write(memoryview(buf).cast("B"))
+
+    def delay_ms(self, delaytime):
+        time.sleep(delaytime / 1000.0 * self.time_scale)
+
+    def module_init(self):
+        self.initialized = True
+        self.asleep = False
+
+    def module_exit(self):
+        self.initialized = False
+
+    # Panel model
+
+    def _write(self, data):
+        with self._lock:
+            self.bytes_sent += len(data)
+
+            # The first byte after selecting starts a command, shared by every chip selected with it
+            offset = 0
+            starting = tuple(chip for chip, transfer in self._current.items() if transfer is None)
+            if starting:
+                transfer = Transfer(starting, data[0], 0)
+                for chip in starting:
+                    self._current[chip] = transfer
+                self._start_command(transfer.command)
+                offset = 1
+
+            data = data[offset:]
+            for transfer in set(self._current.values()):
+                if transfer.command == DATA_START_TRANSMISSION:
+                    start = transfer.length
+                    end = min(start + len(data), HALF_FRAME_BYTES)
+                    for chip in transfer.chips:
+                        self._ram[chip][start:end] = data[:end - start]
+                transfer.length += len(data)
+
+        if self.time_scale:
+            time.sleep(len(data) * 8 / SPI_HZ * self.time_scale)
+
+    def _start_command(self, command):
+        if command == DISPLAY_REFRESH:
+            self._refresh()
+        elif command == DEEP_SLEEP:
+            self.asleep = True
+
+        # After writing the frame, so the PNG encoding does not eat into the modelled refresh
+        if command in COMMAND_BUSY_SECONDS:
+            self._set_busy(COMMAND_BUSY_SECONDS[command])
+
+    def _end_transfer(self, chip):
+        transfer = self._current.pop(chip, None)
+        # Recorded once the last chip taking part is deselected
+        if transfer is not None and transfer not in self._current.values():
+            self.transfers.append(transfer)
+
+    def _set_busy(self, seconds):
+        self._busy_until = max(self._busy_until, time.monotonic() + seconds * self.time_scale)
+
+    def _refresh(self):
+        self.refreshes += 1
+        if not self.save_frames:
+            return
+
+        frame = bytes(self._ram["master"]) + bytes(self._ram["slave"])
+        path = os.path.join(self.directory, "frame.png")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            buffer_to_image(frame).save(f"{path}.tmp", format="PNG")
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.warning(f"Failed to write simulated frame: {e}")
+            return
+        logger.info(f"Simulated refresh {self.refreshes}, frame written to {path}")
+
+    def frame(self) -> bytes:
+        """The panel's frame RAM as a packed buffer, see buffer_utils.unpack_buffer."""
+        with self._lock:
+            return bytes(self._ram["master"]) + bytes(self._ram["slave"])
@@ -29,11 +29,15 @@
 import time
 import os
 import logging
+import struct
 import sys
+from functools import lru_cache
 
 from ctypes import *
 import ctypes
 
+import numpy as np
+
 EPD_SCK_PIN     =11
 EPD_MOSI_PIN    =10
 
@@ -51,25 +55,33 @@ find_dirs = [
     '/usr/local/lib',
     '/usr/lib',
 ]
+
+
+@lru_cache(maxsize=1)
+def library_name():
+    # Detected once, in process: the word size of this interpreter (which is
+    # what the library has to match) and whether this is a Raspberry Pi 5
+    bits = struct.calcsize("P") * 8
+    try:
+        with open('/proc/cpuinfo') as f:
+            pi5 = 'Raspberry Pi 5' in f.read()
+    except OSError:
+        pi5 = False
+    return f"DEV_Config_{64 if bits == 64 else 32}_{'w' if pi5 else 'b'}.so"
+
+
+# Loaded by module_init, so importing this module works without the library
 spi = None
-for find_dir in find_dirs:
-    val = int(os.popen('getconf LONG_BIT').read())
-    val_1 = os.popen("cat /proc/cpuinfo | grep 'Raspberry Pi 5'").read()
-    if val == 64:
-        if val_1 == "":
-            so_filename = os.path.join(find_dir, 'DEV_Config_64_b.so')
-        else:
-            so_filename = os.path.join(find_dir, 'DEV_Config_64_w.so')
-    else:
-        if val_1 == "":
-            so_filename = os.path.join(find_dir, 'DEV_Config_32_b.so')
-        else:
-            so_filename = os.path.join(find_dir, 'DEV_Config_32_w.so')
-    if os.path.exists(so_filename):
-        spi = CDLL(so_filename)
-        break
-if spi is None:
-    RuntimeError('Cannot find DEV_Config.so')
+
+
+def load_library():
+    global spi
+    for find_dir in find_dirs:
+        so_filename = os.path.join(find_dir, library_name())
+        if os.path.exists(so_filename):
+            spi = CDLL(so_filename)
+            return
+    raise RuntimeError('Cannot find DEV_Config.so')
 
 def digital_write(pin, value):
     spi.DEV_Digital_Write(pin, value)
@@ -83,11 +95,22 @@ def spi_writebyte(value):
 def spi_writebyte2(buf, len): 
     array_data = (ctypes.c_ubyte * len)(*buf)
     spi.DEV_SPI_SendData_nByte(array_data, ctypes.c_ulong(len))
+
+def spi_writebuffer(buf):
+    # Accepts any buffer-protocol object (bytes, memoryview, mmap, numpy array).
+    # ctypes from_buffer refuses read-only memory, so the address is taken
+    # through a numpy view instead, nothing is copied either way.
+    # DEV_SPI_SendData_nByte loops over the bytes itself and takes a 32 bit
+    # length, so the whole buffer goes out in a single call.
+    data = np.frombuffer(buf, dtype=np.uint8)
+    spi.DEV_SPI_SendData_nByte(ctypes.c_void_p(data.ctypes.data), ctypes.c_ulong(data.size))
  
 def delay_ms(delaytime):
     time.sleep(delaytime / 1000.0)
         
 def module_init():
+    if spi is None:
+        load_library()
     spi.DEV_ModuleInit()
 
 def module_exit():
@@ -1,16 +1,29 @@
+import asyncio
 import logging
 import threading
-import time
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response
 
-from piframe.const import IMAGE_DELAY_SECONDS, ImageCollection
+from piframe.const import ImageCollection
 from piframe.lib import epd13in3E
-from piframe.utils.image_utils import get_random_image, pre_process_image
+from piframe.utils.image_index import ImageIndex
+from piframe.utils.akinson_dithering import warm_lut
+from piframe.utils.image_utils import load_source, pre_process_buffer
+from piframe.utils.ingest import Ingestor
+from piframe.utils.metrics import REGISTRY, UPLOADS
+from piframe.utils.prefetch import Prefetcher
+from piframe.utils.preview import PreviewCache, etag_matches
+from piframe.utils.render_cache import RenderCache
+from piframe.utils.scheduler import Slideshow
+from piframe.utils.upload import UploadLimitExceeded, receive_uploads
 
 screen = epd13in3E.EPD()
-
-app = FastAPI()
+render_cache = RenderCache()
+image_index = ImageIndex()
+previews = PreviewCache()
+ingestor = Ingestor(render_cache, image_index)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,71 +32,118 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-CURRENT_IMAGE_COLLECTION: ImageCollection = ImageCollection.DEFAULT
 
-next_image_trigger = threading.Event()
+def render(image_path: str, cancel: threading.Event | None = None):
+    buffer = render_cache.get(image_path)
+    if buffer is not None:
+        return buffer
+
+    source = load_source(image_path)
+    if source is None:
+        return None
+
+    # Prepare image
+    buffer = pre_process_buffer(source, cancel=cancel)
+    if buffer is None:
+        return None
+    render_cache.put(image_path, buffer)
+
+    return buffer
+
+
+prefetcher = Prefetcher(render, pick=image_index.random_image)
+slideshow = Slideshow(screen, prefetcher)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    threading.Thread(target=warm_lut, name="warm-lut", daemon=True).start()
+    await slideshow.start()
+    yield
+    await slideshow.stop()
+    await asyncio.to_thread(ingestor.close)
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.post("/next")
-def next_image():
-    next_image_trigger.set()
+async def next_image():
+    slideshow.next()
 
     logger.info(f"Received manual trigger to display next image")
     return {"status": "ok"}
 
 
-@app.post("/collection/{name}")
-def set_collection(name: str):
-    global CURRENT_IMAGE_COLLECTION
-
-    CURRENT_IMAGE_COLLECTION = ImageCollection(name)
-    next_image_trigger.set()
-
-    logger.info(f"Switched image collection to {CURRENT_IMAGE_COLLECTION.name}")
-    return {
-        "status": "ok",
-    }
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 
-def slideshow():
-    try:
-        global CURRENT_IMAGE_COLLECTION
-        logger.info("PiFrame started, initializing display")
+def preview_response(buffer, request: Request) -> Response:
+    if buffer is None:
+        raise HTTPException(status_code=404, detail="No frame")
 
-        screen.Init()
-        screen.Clear()
+    etag, png = previews.get(buffer)
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(png, media_type="image/png", headers=headers)
 
-        while True:
-            image, image_path = get_random_image(CURRENT_IMAGE_COLLECTION.path())
-            if image is None:
-                print("No images found, waiting...")
-                time.sleep(5)
-                continue
 
-            logger.info(f"Drawing next image: {image_path}")
+@app.get("/frame/current.png")
+def current_frame(request: Request):
+    return preview_response(slideshow.current_frame, request)
 
-            # Prepare image
-            image = pre_process_image(image, image_path)
-            
-            screen.display(screen.get_buffer(image))
 
-            # Free up memory
-            del image
+@app.get("/frame/next.png")
+def next_frame(request: Request):
+    _, buffer = prefetcher.peek()
+    return preview_response(buffer, request)
 
-            logger.info(f"Done, waiting {IMAGE_DELAY_SECONDS} seconds")
 
-            next_image_trigger.wait(timeout=IMAGE_DELAY_SECONDS)
-            next_image_trigger.clear()
+@app.post("/collection/{name}")
+async def set_collection(name: str):
+    collection = ImageCollection(name)
+    slideshow.set_collection(collection)
 
-        # This should not be reachable!
-        logger.info("Out of images, clearing screen...")
-        screen.Clear()
+    logger.info(f"Received switch to image collection {collection.name}")
+    return {
+        "status": "ok",
+    }
 
-        logger.info("Going to sleep...")
-        screen.sleep()
-    except Exception:
-        logger.exception("Encountered error, going to sleep")
-        screen.sleep()
 
+@app.post("/collection/{name}/images", status_code=202)
+async def upload_images(name: str, request: Request):
+    """
+    Add images to a collection from a multipart/form-data upload. Responds as
+    soon as the files are stored, they join the slideshow once ingested.
+    """
+    collection = ImageCollection(name)
+    if ingestor.full():
+        raise HTTPException(status_code=503, detail="Too many uploads in progress, try again later")
 
-threading.Thread(target=slideshow, daemon=True).start()
+    directory = collection.path()
+    try:
+        uploads, rejected = await receive_uploads(
+            request,
+            directory,
+            lambda upload: ingestor.submit(upload, directory),
+            has_room=lambda: not ingestor.full(),
+        )
+    except UploadLimitExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    busy = sum(1 for entry in rejected if entry["reason"] == "busy")
+    if busy:
+        UPLOADS.inc("busy", amount=busy)
+    accepted = [upload.filename for upload in uploads]
+
+    logger.info(f"Accepted {len(accepted)} upload(s) for {collection.name}, rejected {len(rejected)}")
+    return {
+        "status": "accepted",
+        "accepted": accepted,
+        "rejected": rejected,
+    }
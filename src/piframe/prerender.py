@@ -0,0 +1,164 @@
+"""
+Render whole image collections into the render cache ahead of time.
+
+Every image is decoded, processed, dithered and packed exactly like the
+slideshow does it, spread over a process pool. Images that already have an up
+to date cache entry are skipped, so an interrupted run can simply be started
+again.
+
+Usage:
+    python -m piframe.prerender [collections...] [--workers N] [--cache-dir DIR] [--max-bytes N]
+
+Run it from the PiFrame working directory, or point --cache-dir at the Pi's
+cache. Entries are keyed on the absolute image path, so a different machine
+has to mount the library at the same path (/mnt/frame-images).
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from piframe.const import ImageCollection, RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES, DISPLAY_WIDTH, DISPLAY_HEIGHT
+from piframe.utils.akinson_dithering import warm_lut
+from piframe.utils.image_index import ImageIndex
+from piframe.utils.image_utils import load_source, pre_process_buffer
+from piframe.utils.render_cache import RenderCache
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+FRAME_BYTES = DISPLAY_WIDTH * DISPLAY_HEIGHT // 2
+
+# Seconds between progress reports
+PROGRESS_INTERVAL = 5.0
+
+# Renders queued per worker process, enough to keep the workers busy while
+# only a few finished buffers wait in memory at a time
+IN_FLIGHT_PER_WORKER = 2
+
+
+def render_buffer(image_path: str) -> bytes | None:
+    """Render an image to a packed panel buffer, runs in a worker process."""
+    source = load_source(image_path)
+    if source is None:
+        return None
+
+    # The pool already keeps every core busy
+    return pre_process_buffer(source, dither_threads=1)
+
+
+def collect_images(collections: list[ImageCollection]) -> list[str]:
+    index = ImageIndex()
+
+    paths = []
+    seen = set()
+    for collection in collections:
+        for path in index.images(collection.path()):
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def prerender(collections: list[ImageCollection], cache: RenderCache, workers: int | None = None) -> dict:
+    paths = collect_images(collections)
+    pending = [path for path in paths if not cache.contains(path)]
+    skipped = len(paths) - len(pending)
+
+    logger.info(f"{len(paths)} images, {skipped} already cached, {len(pending)} to render")
+
+    if len(paths) * FRAME_BYTES > cache.max_bytes:
+        logger.warning(
+            f"{len(paths)} frames need {len(paths) * FRAME_BYTES / 2 ** 20:.0f} MB, more than the cache limit "
+            f"of {cache.max_bytes / 2 ** 20:.0f} MB. Earlier frames will be evicted again."
+        )
+
+    # Load (or build) the palette LUT once here, instead of in every worker
+    warm_lut()
+
+    rendered = 0
+    failed = 0
+    start = time.monotonic()
+    last_report = start
+
+    workers = workers or os.cpu_count() or 1
+    remaining = iter(pending)
+    done = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        while True:
+            # Refill up to the limit, so memory stays bounded however large the collection
+            while len(futures) < workers * IN_FLIGHT_PER_WORKER:
+                path = next(remaining, None)
+                if path is None:
+                    break
+                futures[executor.submit(render_buffer, path)] = path
+            if not futures:
+                break
+
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path = futures.pop(future)
+                try:
+                    buffer = future.result()
+                except Exception:
+                    logger.exception(f"Failed to render {path}")
+                    buffer = None
+
+                if buffer is None:
+                    failed += 1
+                else:
+                    cache.put(path, buffer)
+                    rendered += 1
+                del buffer
+                done += 1
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL or done == len(pending):
+                last_report = now
+                rate = done / (now - start)
+                eta = (len(pending) - done) / rate if rate > 0 else 0
+                logger.info(f"[{done}/{len(pending)}] {rate:.2f} images/s, {eta:.0f}s remaining")
+
+    elapsed = time.monotonic() - start
+    return {
+        "total": len(paths),
+        "skipped": skipped,
+        "rendered": rendered,
+        "failed": failed,
+        "seconds": elapsed,
+        "images_per_second": rendered / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render image collections into the PiFrame render cache")
+    parser.add_argument("collections", nargs="*", metavar="collection",
+                        help=f"collections to render ({', '.join(c.value for c in ImageCollection)}), all if omitted")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--cache-dir", default=RENDER_CACHE_DIR, help="render cache directory")
+    parser.add_argument("--max-bytes", type=int, default=RENDER_CACHE_MAX_BYTES, help="render cache size limit")
+    args = parser.parse_args()
+
+    try:
+        collections = [ImageCollection(name) for name in args.collections] or list(ImageCollection)
+    except ValueError as e:
+        parser.error(str(e))
+
+    cache = RenderCache(args.cache_dir, args.max_bytes)
+
+    summary = prerender(collections, cache, args.workers)
+    logger.info(
+        f"Rendered {summary['rendered']} images in {summary['seconds']:.1f}s "
+        f"({summary['images_per_second']:.2f} images/s), {summary['skipped']} skipped, {summary['failed']} failed"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,22 @@
 from __future__ import annotations
 
+import logging
+import threading
+import time
 from functools import lru_cache
 
 import atkinson_rs
 import numpy as np
 from PIL import Image
 
+from piframe.const import DITHER_LUT_BITS, DITHER_LUT_METRIC, SPECTRA6_DITHER_PALETTE
+from piframe.utils.palette_lut import load_lut
+
+logger = logging.getLogger(__name__)
+
+# Lets a render wait for a LUT that is being built or loaded elsewhere, instead of building it twice
+_lut_lock = threading.Lock()
+
 
 def _unique_palette_flat(palette_flat: tuple[int, ...]) -> tuple[int, ...]:
     cols = [tuple(palette_flat[i:i + 3]) for i in range(0, len(palette_flat), 3)]
@@ -22,62 +33,104 @@ def _palette_rgb_from_flat(palette_flat: tuple[int, ...]) -> np.ndarray:
 
 
 @lru_cache(maxsize=16)
-def _lut_and_palette_bytes(palette_flat: tuple[int, ...]) -> tuple[bytes, bytes, int]:
+def _lut_and_palette_bytes(
+        palette_flat: tuple[int, ...],
+        bits: int = DITHER_LUT_BITS,
+        metric: str = DITHER_LUT_METRIC,
+) -> tuple[bytes, bytes, int]:
     """
     Returns (lut_bytes, palette_bytes, k) for a given palette_flat.
-    Cached so it's built once per palette.
+    Cached so it's loaded once per palette, the LUT itself is persisted on disk.
     """
     palette_rgb = _palette_rgb_from_flat(palette_flat)  # (K,3) uint8
     k = int(palette_rgb.shape[0])
 
-    # Build 5-bit LUT: 32*32*32 = 32768 entries
-    vals = np.linspace(0, 255, 32, dtype=np.float32)
-    r, g, b = np.meshgrid(vals, vals, vals, indexing="ij")
-    grid = np.stack([r, g, b], axis=-1).reshape(-1, 3).astype(np.float32)  # (32768,3)
+    with _lut_lock:
+        lut = load_lut(palette_rgb, bits, metric)  # (2^(3*bits),)
+    return lut, palette_rgb.tobytes(), k
 
-    pal = palette_rgb.astype(np.float32)
-    d2 = np.empty((grid.shape[0], k), dtype=np.float32)
-    for i in range(k):
-        diff = grid - pal[i]
-        d2[:, i] = np.sum(diff * diff, axis=1)
 
-    lut = np.argmin(d2, axis=1).astype(np.uint8)  # (32768,)
-    return lut.tobytes(), palette_rgb.tobytes(), k
+def warm_lut(palette_flat: tuple[int, ...] = SPECTRA6_DITHER_PALETTE):
+    """Load (or build) the dither LUT ahead of the first render, e.g. on a background thread at startup."""
+    start = time.perf_counter()
+    _lut_and_palette_bytes(tuple(palette_flat))
+    logger.info(f"Dither LUT ready in {time.perf_counter() - start:.2f}s")
 
 
-def atkinson_dither(
+def atkinson_indices(
         img: Image.Image,
         palette_flat: tuple[int, ...],
         *,
         serpentine: bool = True,
-) -> Image.Image:
+        threads: int = 1,
+) -> np.ndarray:
     """
-    Dither a PIL image to the given palette using Rust Atkinson + 5-bit LUT.
+    Dither a PIL image to the given palette using Rust Atkinson + palette LUT.
     You only pass (image, palette_flat). Everything else is internal/cached.
+    The LUT resolution and color distance follow DITHER_LUT_BITS / DITHER_LUT_METRIC.
 
-    Returns a P-mode image with the palette attached.
+    With threads > 1 (0 for every core) rows are dithered in parallel in a
+    staggered wavefront, with the same result as on a single thread. This only
+    applies without serpentine scanning, which is inherently sequential.
+
+    Returns a (H,W) uint8 array of indices into the (deduplicated) palette.
     """
-    img = img.convert("RGB")
+    if img.mode != "RGB":
+        img = img.convert("RGB")
     arr = np.asarray(img, dtype=np.uint8)
     h, w, _ = arr.shape
 
     lut_bytes, pal_bytes, k = _lut_and_palette_bytes(tuple(palette_flat))
 
-    idx_bytes = atkinson_rs.atkinson_lut(
-        arr.tobytes(),
+    # Dithered straight into the output array, with the GIL released meanwhile
+    idx = np.empty((h, w), dtype=np.uint8)
+    atkinson_rs.atkinson_lut_into(
+        arr,
         w,
         h,
         lut_bytes,
         pal_bytes,
+        idx,
         serpentine,
+        threads,
     )
+    return idx
+
 
-    idx = np.frombuffer(idx_bytes, dtype=np.uint8).reshape((h, w))
+def atkinson_dither(
+        img: Image.Image,
+        palette_flat: tuple[int, ...],
+        *,
+        serpentine: bool = True,
+        threads: int = 1,
+) -> Image.Image:
+    """
+    Like atkinson_indices, but returns a P-mode image with the palette attached
+    for preview/export.
+    """
+    idx = atkinson_indices(img, palette_flat, serpentine=serpentine, threads=threads)
     out = Image.fromarray(idx, mode="P")
 
     # Attach palette for preview/export (pad to 256 colors)
+    _, pal_bytes, k = _lut_and_palette_bytes(tuple(palette_flat))
     pal_u8 = np.frombuffer(pal_bytes, dtype=np.uint8)
     pal_list = pal_u8.tolist() + [0, 0, 0] * (256 - k)
     out.putpalette(pal_list)
 
     return out
+
+
+def atkinson_stream(
+        width: int,
+        height: int,
+        palette_flat: tuple[int, ...],
+        *,
+        serpentine: bool = True,
+        threads: int = 1,
+) -> atkinson_rs.AtkinsonStream:
+    """
+    Ditherer that takes the image as consecutive bands of rows through
+    feed(rgb_rows, out_indices), with the same result as atkinson_indices.
+    """
+    lut_bytes, pal_bytes, _ = _lut_and_palette_bytes(tuple(palette_flat))
+    return atkinson_rs.AtkinsonStream(width, height, lut_bytes, pal_bytes, serpentine, threads)
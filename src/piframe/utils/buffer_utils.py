@@ -0,0 +1,73 @@
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from piframe.const import DISPLAY_HEIGHT, SPECTRA6_DRIVER_PALETTE
+
+IDENTITY_MAPPING = bytes(range(16))
+
+
+@lru_cache(maxsize=4)
+def _pair_table(mapping: bytes) -> np.ndarray:
+    """Packed byte for every (left, right) pair of 4 bit indices, remapped through `mapping`."""
+    m = np.zeros(16, dtype=np.uint8)
+    m[:len(mapping)] = np.frombuffer(mapping, dtype=np.uint8)
+    return ((m[:, None] << 4) | m[None, :]).ravel()
+
+
+def pack_rows(indices: np.ndarray, mapping: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pack a (H,W) array of palette indices into 4bpp rows, split into the
+    (H,W/4) master and slave halves of the panel.
+
+    Two pixels share a byte, high nibble first.
+
+    Args:
+        indices: (H,W) indices, driver palette indices unless `mapping` is given
+        mapping: Driver index for every index, e.g. DITHER_TO_DRIVER. Applied
+            while packing through a pair table, so no remapped copy is made.
+    """
+    indices = np.asarray(indices, dtype=np.uint8)
+    table = _pair_table(IDENTITY_MAPPING if mapping is None else np.asarray(mapping, dtype=np.uint8).tobytes())
+    pairs = (indices[:, 0::2] << 4) | indices[:, 1::2]
+
+    half = pairs.shape[1] // 2
+    return table[pairs[:, :half]], table[pairs[:, half:]]
+
+
+def pack_buffer(indices: np.ndarray, mapping: np.ndarray | None = None) -> bytes:
+    """
+    Pack a (H,W) array of palette indices into the 4bpp panel buffer, see pack_rows.
+
+    The 13.3" panel is driven as two halves, so the buffer holds every row's
+    left half (master) followed by every row's right half (slave), each half
+    contiguous and ready to be streamed.
+    """
+    return b"".join(pack_rows(indices, mapping))
+
+
+def unpack_buffer(buffer, height: int = DISPLAY_HEIGHT) -> np.ndarray:
+    """Inverse of pack_buffer, returns the (H,W) driver palette indices of a packed panel buffer."""
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    half = data.size // 2
+    pairs = np.concatenate((data[:half].reshape(height, -1), data[half:].reshape(height, -1)), axis=1)
+
+    indices = np.empty((height, pairs.shape[1] * 2), dtype=np.uint8)
+    indices[:, 0::2] = pairs >> 4
+    indices[:, 1::2] = pairs & 0x0F
+    return indices
+
+
+def buffer_to_image(buffer, height: int = DISPLAY_HEIGHT) -> Image.Image:
+    """P-mode image of a packed panel buffer in the colors of the driver palette."""
+    image = Image.fromarray(unpack_buffer(buffer, height), mode="P")
+    image.putpalette(list(SPECTRA6_DRIVER_PALETTE) + [0, 0, 0] * (256 - len(SPECTRA6_DRIVER_PALETTE) // 3))
+    return image
+
+
+def split_buffer(buffer) -> tuple[memoryview, memoryview]:
+    """Return zero-copy (master, slave) views of a packed panel buffer."""
+    view = memoryview(buffer)
+    half = len(view) // 2
+    return view[:half], view[half:]
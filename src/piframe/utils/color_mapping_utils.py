@@ -1,7 +1,17 @@
+from functools import lru_cache
+
 import numpy as np
 from PIL import Image
 from skimage.color import rgb2lab
 
+from piframe.const import QUANTIZE_MAX_BYTES
+from piframe.utils.palette_lut import load_lut
+
+# Rough working memory per pixel of a chunk: float RGB input, rgb2lab's
+# intermediates and the Lab result, all float32
+QUANTIZE_BYTES_PER_PIXEL = 64
+
+
 def _palette_rgb_to_lab(palette_rgb: np.ndarray) -> np.ndarray:
     """
     palette_rgb: (K,3) uint8
@@ -11,33 +21,74 @@ def _palette_rgb_to_lab(palette_rgb: np.ndarray) -> np.ndarray:
     pal_lab = rgb2lab(pal).astype(np.float32)[0]                # (K,3)
     return pal_lab
 
-def quantize_lab_nearest(img_rgb: Image.Image, palette_flat: tuple) -> Image.Image:
+
+@lru_cache(maxsize=2)
+def _lab_lut(palette_bytes: bytes) -> np.ndarray:
+    """Exact 8-bit Lab LUT for the palette, kept in memory after the first use."""
+    palette_rgb = np.frombuffer(palette_bytes, dtype=np.uint8).reshape(-1, 3)
+    return np.frombuffer(load_lut(palette_rgb, 8, "lab"), dtype=np.uint8)
+
+
+def _nearest_lab(rgb: np.ndarray, pal_lab: np.ndarray) -> np.ndarray:
+    """
+    rgb: (N,3) uint8
+    returns: (N,) uint8 index of the nearest palette color in Lab
+    """
+    lab = rgb2lab(rgb.astype(np.float32) / 255.0).astype(np.float32)  # (N,3)
+
+    # dist^2 = sum((lab - pal_lab)^2) over channels
+    d2 = np.empty((rgb.shape[0], pal_lab.shape[0]), dtype=np.float32)
+    for i in range(pal_lab.shape[0]):
+        dl = lab[:, 0] - pal_lab[i, 0]
+        da = lab[:, 1] - pal_lab[i, 1]
+        db = lab[:, 2] - pal_lab[i, 2]
+        d2[:, i] = dl*dl + da*da + db*db
+
+    return np.argmin(d2, axis=1).astype(np.uint8)
+
+
+def quantize_lab_nearest(
+        img_rgb: Image.Image,
+        palette_flat: tuple,
+        *,
+        max_bytes: int = QUANTIZE_MAX_BYTES,
+        use_lut: bool = False,
+) -> Image.Image:
     """
     Returns a P-mode image whose pixels are indices into the provided palette,
     chosen by nearest color in Lab (perceptual).
+
+    The image is converted in row chunks, so the Lab copy and distance table
+    never need more than about `max_bytes` on top of the image itself.
+    With `use_lut` every pixel is looked up in the exact 8-bit Lab table for the
+    palette instead (16MB, built once, then read from disk and kept in memory),
+    which skips rgb2lab entirely. Both give the same result as a full frame conversion.
     """
-    rgb = np.array(img_rgb.convert("RGB"), dtype=np.uint8)          # (H,W,3)
+    if img_rgb.mode != "RGB":
+        img_rgb = img_rgb.convert("RGB")
+    rgb = np.asarray(img_rgb, dtype=np.uint8)  # (H,W,3)
     h, w, _ = rgb.shape
 
     # Build palette arrays
     palette_rgb = np.array([palette_flat[i:i+3] for i in range(0, len(palette_flat), 3)], dtype=np.uint8)
     k = palette_rgb.shape[0]
-    pal_lab = _palette_rgb_to_lab(palette_rgb)
 
-    # Convert image to Lab in one vectorized shot
-    lab = rgb2lab(rgb.astype(np.float32) / 255.0).astype(np.float32)  # (H,W,3)
+    idx = np.empty((h, w), dtype=np.uint8)
 
-    # Compute nearest palette index (vectorized)
-    # dist^2 = sum((lab - pal_lab)^2) over channels
-    # result: (H,W)
-    d2 = np.empty((h, w, k), dtype=np.float32)
-    for i in range(k):
-        dl = lab[:, :, 0] - pal_lab[i, 0]
-        da = lab[:, :, 1] - pal_lab[i, 1]
-        db = lab[:, :, 2] - pal_lab[i, 2]
-        d2[:, :, i] = dl*dl + da*da + db*db
-
-    idx = np.argmin(d2, axis=2).astype(np.uint8)  # (H,W)
+    if use_lut:
+        lut = _lab_lut(palette_rgb.tobytes())
+    else:
+        pal_lab = _palette_rgb_to_lab(palette_rgb)
+
+    rows = max(1, max_bytes // (w * (QUANTIZE_BYTES_PER_PIXEL + 4 * k)))
+    for y in range(0, h, rows):
+        chunk = rgb[y:y + rows].reshape(-1, 3)
+
+        if use_lut:
+            key = (chunk[:, 0].astype(np.uint32) << 16) | (chunk[:, 1].astype(np.uint32) << 8) | chunk[:, 2]
+            idx[y:y + rows] = lut[key].reshape(-1, w)
+        else:
+            idx[y:y + rows] = _nearest_lab(chunk, pal_lab).reshape(-1, w)
 
     out = Image.fromarray(idx, mode="P")
     # putpalette expects 768-length, so pad
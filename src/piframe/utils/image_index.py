@@ -0,0 +1,180 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+
+from piframe.const import IMAGE_INDEX_PATH, IMAGE_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent);
+
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_directory ON images (directory);
+"""
+
+
+class ImageIndex:
+    """
+    Persistent index of the image library, backed by SQLite.
+
+    A directory is only listed again when its mtime changed since the last scan,
+    so checking for new images costs a single stat per directory instead of a
+    full listing over NFS. Random picks are served from an in-memory list of
+    the directory's images.
+    """
+
+    def __init__(self, db_path: str = IMAGE_INDEX_PATH):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._paths: dict[str, list[str]] = {}
+
+    def random_image(self, directory: str) -> str | None:
+        """
+        Return the full path of a random image in the directory, or None if it has none.
+        """
+        directory = os.path.abspath(directory)
+
+        with self._lock:
+            self._refresh(directory, recursive=False)
+            paths = self._cached_paths(directory)
+
+        if not paths:
+            return None
+
+        return random.choice(paths)
+
+    def images(self, directory: str, recursive: bool = False) -> list[str]:
+        directory = os.path.abspath(directory)
+
+        with self._lock:
+            self._refresh(directory, recursive)
+
+            if not recursive:
+                return list(self._cached_paths(directory))
+
+            rows = self._db.execute(
+                "SELECT path FROM images WHERE directory = ? OR substr(directory, 1, ?) = ? ORDER BY path",
+                (directory, len(directory) + 1, directory + os.sep),
+            )
+            return [path for path, in rows]
+
+    def count(self, directory: str, recursive: bool = False) -> int:
+        directory = os.path.abspath(directory)
+
+        with self._lock:
+            self._refresh(directory, recursive)
+
+            if not recursive:
+                return len(self._cached_paths(directory))
+
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM images WHERE directory = ? OR substr(directory, 1, ?) = ?",
+                (directory, len(directory) + 1, directory + os.sep),
+            ).fetchone()
+            return row[0]
+
+    def add(self, image_path: str):
+        """Register a newly added image right away, without waiting for its directory to be scanned."""
+        image_path = os.path.abspath(image_path)
+        directory = os.path.dirname(image_path)
+
+        with self._lock, self._db:
+            cursor = self._db.execute("INSERT OR IGNORE INTO images (path, directory) VALUES (?, ?)",
+                                      (image_path, directory))
+            paths = self._paths.get(directory)
+            if cursor.rowcount and paths is not None:
+                paths.append(image_path)
+
+    def _cached_paths(self, directory: str) -> list[str]:
+        paths = self._paths.get(directory)
+        if paths is None:
+            rows = self._db.execute("SELECT path FROM images WHERE directory = ? ORDER BY path", (directory,))
+            paths = self._paths[directory] = [path for path, in rows]
+        return paths
+
+    def _refresh(self, directory: str, recursive: bool):
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError as e:
+            logger.warning(f"Failed to stat {directory}, using indexed contents: {e}")
+            return
+
+        row = self._db.execute("SELECT mtime_ns FROM directories WHERE path = ?", (directory,)).fetchone()
+        if row is None or row[0] != mtime_ns:
+            self._scan(directory, mtime_ns)
+
+        if recursive:
+            rows = self._db.execute("SELECT path FROM directories WHERE parent = ?", (directory,)).fetchall()
+            for subdirectory, in rows:
+                self._refresh(subdirectory, recursive)
+
+    def _scan(self, directory: str, mtime_ns: int):
+        files = set()
+        subdirectories = set()
+
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        subdirectories.add(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                        files.add(entry.path)
+        except OSError as e:
+            logger.warning(f"Failed to scan {directory}, using indexed contents: {e}")
+            return
+
+        indexed = {path for path, in self._db.execute("SELECT path FROM images WHERE directory = ?", (directory,))}
+        indexed_subdirectories = {
+            path for path, in self._db.execute("SELECT path FROM directories WHERE parent = ?", (directory,))
+        }
+
+        added = files - indexed
+        removed = indexed - files
+
+        with self._db:
+            self._db.executemany("INSERT INTO images (path, directory) VALUES (?, ?)",
+                                 [(path, directory) for path in added])
+            self._db.executemany("DELETE FROM images WHERE path = ?", [(path,) for path in removed])
+
+            # A subdirectory scanned on its own before has no parent yet
+            self._db.executemany(
+                "INSERT INTO directories (path, parent) VALUES (?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET parent = excluded.parent",
+                [(path, directory) for path in subdirectories - indexed_subdirectories],
+            )
+            for path in indexed_subdirectories - subdirectories:
+                self._forget(path)
+
+            self._db.execute(
+                "INSERT INTO directories (path, mtime_ns) VALUES (?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET mtime_ns = excluded.mtime_ns",
+                (directory, mtime_ns),
+            )
+
+        self._paths.pop(directory, None)
+        logger.info(f"Indexed {directory}: {len(added)} added, {len(removed)} removed, {len(files)} total")
+
+    def _forget(self, directory: str):
+        """Drop a vanished directory and everything below it from the index."""
+        prefix = (len(directory) + 1, directory + os.sep)
+        self._db.execute("DELETE FROM images WHERE directory = ? OR substr(directory, 1, ?) = ?",
+                         (directory, *prefix))
+        self._db.execute("DELETE FROM directories WHERE path = ? OR substr(path, 1, ?) = ?",
+                         (directory, *prefix))
+
+        for path in [p for p in self._paths if p == directory or p.startswith(directory + os.sep)]:
+            del self._paths[path]
@@ -1,16 +1,20 @@
-import colorsys
 import logging
 import os
 import random
+import threading
+import time
 
 import numpy as np
-import piexif
-from PIL import Image, ImageEnhance, ImageFont, ImageDraw, ImageFilter, ImageOps
+from PIL import Image, ImageEnhance, ImageFont, ImageDraw, ImageFilter, ImageOps, ImageStat
 
 from piframe.const import DISPLAY_HEIGHT, DISPLAY_WIDTH, FONTS_DIR, SPECTRA6_DITHER_PALETTE, DITHER_TO_DRIVER, \
-    SPECTRA6_DRIVER_PALETTE
-from piframe.utils.akinson_dithering import atkinson_dither
+    SPECTRA6_DRIVER_PALETTE, CONTRAST_FACTOR, VIBRANCE_AMOUNT, GAMMA, DITHER_SERPENTINE, DITHER_THREADS, \
+    IMAGE_EXTENSIONS, RESIZE_REDUCING_GAP, RENDER_BAND_ROWS, RENDER_MEMORY_CEILING
+from piframe.utils.akinson_dithering import atkinson_dither, atkinson_stream
+from piframe.utils.buffer_utils import pack_rows
+from piframe.utils.metrics import STAGE_SECONDS
 from piframe.utils.open_street_map_utils import coords_to_address
+from piframe.utils.source_image import SourceImage
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,14 +23,142 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Rows per chunk for the vectorized color enhancement
+ENHANCE_CHUNK_ROWS = 64
 
-def pre_process_image(image: Image.Image, image_path: str):
-    image = correct_image_orientation(image, image_path)
-    image = resize_for_spectra6(image)
-    image = enhance_colors(image)
+ONE_THIRD = 1.0 / 3.0
+ONE_SIXTH = 1.0 / 6.0
+TWO_THIRD = 2.0 / 3.0
 
-    image = atkinson_dither(image, SPECTRA6_DITHER_PALETTE)
-    image = remap_to_driver(image)
+# Rough peak working memory per pixel of a render band, dominated by the
+# float64 temporaries of the vibrance step
+BAND_BYTES_PER_PIXEL = 160
+
+
+def _prepare_for_dither(source: SourceImage) -> Image.Image:
+    with STAGE_SECONDS.time("decode"):
+        image = source.open()
+    with STAGE_SECONDS.time("orientation"):
+        image = correct_image_orientation(image, source.orientation)
+    with STAGE_SECONDS.time("resize"):
+        image = resize_for_spectra6(image)
+    with STAGE_SECONDS.time("enhance"):
+        image = enhance_colors(image)
+    return image
+
+
+def render_bands(
+        source: SourceImage,
+        *,
+        dither_threads: int = DITHER_THREADS,
+        band_rows: int = RENDER_BAND_ROWS,
+        max_bytes: int = RENDER_MEMORY_CEILING,
+):
+    """
+    Process an image to packed panel rows, one horizontal band at a time.
+
+    Decoding, orientation and the resize work on the whole image. After that
+    the padding, enhancement, dithering and packing run per band of
+    `band_rows` rows, so no full frame RGB, float or index copies exist. The
+    dither output is remapped to driver indices while it is packed.
+
+    The source bytes and its decode are kept under `max_bytes` minus the
+    band working set. Larger sources are decoded at a reduced size (see
+    SourceImage.open), only ones that cannot be brought under it raise a
+    ValueError before they are decoded.
+
+    Yields:
+        tuple: (master, slave) uint8 arrays of shape (rows, DISPLAY_WIDTH / 4),
+        the band's packed rows for each half of the panel
+    """
+    # Everything besides the decoded source: the resized image, one band and the packed frame
+    working_set = (DISPLAY_WIDTH * DISPLAY_HEIGHT * 3 + band_rows * DISPLAY_WIDTH * BAND_BYTES_PER_PIXEL
+                   + DISPLAY_WIDTH * DISPLAY_HEIGHT // 2)
+
+    with STAGE_SECONDS.time("decode"):
+        image = source.open(max_bytes=max_bytes - working_set)
+    with STAGE_SECONDS.time("orientation"):
+        image = correct_image_orientation(image, source.orientation)
+    with STAGE_SECONDS.time("resize"):
+        image, x_offset, y_offset = _fit_to_display(image)
+
+    mean = _padded_mean(image)
+    gamma_table = np.array(_gamma_table(GAMMA), dtype=np.uint8)
+
+    ditherer = atkinson_stream(DISPLAY_WIDTH, DISPLAY_HEIGHT, SPECTRA6_DITHER_PALETTE,
+                               serpentine=DITHER_SERPENTINE, threads=dither_threads)
+    band = np.empty((band_rows, DISPLAY_WIDTH, 3), dtype=np.uint8)
+    indices = np.empty((band_rows, DISPLAY_WIDTH), dtype=np.uint8)
+    stage_seconds = {"enhance": 0.0, "dither": 0.0, "pack": 0.0}
+
+    for y in range(0, DISPLAY_HEIGHT, band_rows):
+        rows = min(band_rows, DISPLAY_HEIGHT - y)
+
+        # Cut the band out of the resized image on its white background
+        band[:rows] = 255
+        top, bottom = max(y, y_offset), min(y + rows, y_offset + image.height)
+        if top < bottom:
+            rgb = np.asarray(image.crop((0, top - y_offset, image.width, bottom - y_offset)), dtype=np.uint8)
+            band[top - y:bottom - y, x_offset:x_offset + image.width] = rgb
+
+        started = time.perf_counter()
+        for start in range(0, rows, ENHANCE_CHUNK_ROWS):
+            chunk = band[start:min(start + ENHANCE_CHUNK_ROWS, rows)]
+            chunk[:] = _enhance_array(chunk, mean, gamma_table)
+        enhanced = time.perf_counter()
+        ditherer.feed(band[:rows], indices[:rows])
+        dithered = time.perf_counter()
+        packed = pack_rows(indices[:rows], DITHER_TO_DRIVER)
+        stage_seconds["enhance"] += enhanced - started
+        stage_seconds["dither"] += dithered - enhanced
+        stage_seconds["pack"] += time.perf_counter() - dithered
+
+        # Outside the timers, the consumer sends the band to the panel meanwhile
+        yield packed
+
+    # One observation per frame, like the whole frame stages above
+    for stage, seconds in stage_seconds.items():
+        STAGE_SECONDS.observe(seconds, stage)
+
+
+def pre_process_buffer(
+        source: SourceImage,
+        *,
+        dither_threads: int = DITHER_THREADS,
+        cancel: threading.Event | None = None,
+) -> bytes | None:
+    """
+    Process an image straight to the packed 4bpp panel buffer, band by band
+    (see render_bands). Gives the same buffer as EPD.get_buffer(pre_process_image(source)).
+
+    Returns None when `cancel` gets set before the last band is done.
+    """
+    half = DISPLAY_WIDTH * DISPLAY_HEIGHT // 4
+    buffer = np.empty(2 * half, dtype=np.uint8)
+
+    master_end = 0
+    for master, slave in render_bands(source, dither_threads=dither_threads):
+        if cancel is not None and cancel.is_set():
+            return None
+        buffer[master_end:master_end + master.size] = master.ravel()
+        buffer[half + master_end:half + master_end + slave.size] = slave.ravel()
+        master_end += master.size
+
+    return buffer.tobytes()
+
+
+def pre_process_image(source: SourceImage, *, dither_threads: int = DITHER_THREADS):
+    """
+    Process an image to a P-mode image of driver indices, for previews.
+    The slideshow uses pre_process_buffer instead.
+    """
+    image = _prepare_for_dither(source)
+
+    with STAGE_SECONDS.time("dither"):
+        image = atkinson_dither(image, SPECTRA6_DITHER_PALETTE, serpentine=DITHER_SERPENTINE,
+                               threads=dither_threads)
+    with STAGE_SECONDS.time("remap"):
+        image = remap_to_driver(image)
 
     return image
 
@@ -49,43 +181,133 @@ def apply_vibrance(
         max_s: float = 0.65,
         highlight_protect: float = 0.20,
 ) -> Image.Image:
-    img = img.convert("RGB")
-    px = img.load()
-    w, h = img.size
-
-    for y in range(h):
-        for x in range(w):
-            r, g, b = px[x, y]
-            rf, gf, bf = r / 255.0, g / 255.0, b / 255.0
-            h_, l_, s_ = colorsys.rgb_to_hls(rf, gf, bf)
-
-            if s_ < max_s:
-                boost = (1.0 - s_) * amount
-                boost *= (1.0 - highlight_protect * l_)
-                s2 = min(1.0, s_ + boost)
-                r2, g2, b2 = colorsys.hls_to_rgb(h_, l_, s2)
-                px[x, y] = (int(r2 * 255), int(g2 * 255), int(b2 * 255))
+    rgb = np.asarray(img.convert("RGB"), dtype=np.uint8)
+    out = np.empty_like(rgb)
+
+    for y in range(0, rgb.shape[0], ENHANCE_CHUNK_ROWS):
+        out[y:y + ENHANCE_CHUNK_ROWS] = _vibrance_array(
+            rgb[y:y + ENHANCE_CHUNK_ROWS],
+            amount=amount,
+            max_s=max_s,
+            highlight_protect=highlight_protect,
+        )
 
-    return img
+    return Image.fromarray(out, mode="RGB")
 
 
-def apply_gamma(img: Image.Image, gamma) -> Image.Image:
+def _vibrance_array(
+        rgb: np.ndarray,
+        *,
+        amount: float,
+        max_s: float = 0.65,
+        highlight_protect: float = 0.20,
+) -> np.ndarray:
+    """
+    Vectorized vibrance on a (H,W,3) uint8 array.
+    Mirrors colorsys.rgb_to_hls/hls_to_rgb operation for operation (float64),
+    so results match the per-pixel implementation.
+    """
+    f = rgb.astype(np.float64) / 255.0
+    r, g, b = f[..., 0], f[..., 1], f[..., 2]
+
+    # colorsys.rgb_to_hls
+    maxc = np.maximum(np.maximum(r, g), b)
+    minc = np.minimum(np.minimum(r, g), b)
+    sumc = maxc + minc
+    rangec = maxc - minc
+    l_ = sumc / 2.0
+    gray = minc == maxc
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s_ = np.where(l_ <= 0.5, rangec / sumc, rangec / (2.0 - maxc - minc))
+        rc = (maxc - r) / rangec
+        gc = (maxc - g) / rangec
+        bc = (maxc - b) / rangec
+    h_ = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h_ = np.mod(h_ / 6.0, 1.0)
+    h_[gray] = 0.0
+    s_[gray] = 0.0
+
+    # Saturation boost, strongest for muted colors and protected in highlights
+    boost = (1.0 - s_) * amount
+    boost *= (1.0 - highlight_protect * l_)
+    s2 = np.minimum(1.0, s_ + boost)
+
+    # colorsys.hls_to_rgb
+    m2 = np.where(l_ <= 0.5, l_ * (1.0 + s2), l_ + s2 - (l_ * s2))
+    m1 = 2.0 * l_ - m2
+
+    def _v(hue):
+        hue = np.mod(hue, 1.0)
+        return np.select(
+            [hue < ONE_SIXTH, hue < 0.5, hue < TWO_THIRD],
+            [m1 + (m2 - m1) * hue * 6.0, m2, m1 + (m2 - m1) * (TWO_THIRD - hue) * 6.0],
+            m1,
+        )
+
+    out = np.stack([_v(h_ + ONE_THIRD), _v(h_), _v(h_ - ONE_THIRD)], axis=-1)
+    out[s2 == 0.0] = l_[s2 == 0.0, None]
+    out = (out * 255).astype(np.uint8)
+
+    return np.where((s_ < max_s)[..., None], out, rgb)
+
+
+def _gamma_table(gamma) -> list[int]:
     # gamma < 1 brightens midtones, >1 darkens midtones
     inv = 1.0 / gamma
-    table = [int(((i / 255.0) ** inv) * 255) for i in range(256)]
-    return img.point(table * 3)
+    return [int(((i / 255.0) ** inv) * 255) for i in range(256)]
+
+
+def apply_gamma(img: Image.Image, gamma) -> Image.Image:
+    return img.point(_gamma_table(gamma) * 3)
+
+
+def _contrast_array(rgb: np.ndarray, mean: int, factor: float) -> np.ndarray:
+    """
+    Same blend as ImageEnhance.Contrast: mean + factor * (px - mean) in float32, truncated.
+    """
+    out = np.float32(mean) + np.float32(factor) * (rgb.astype(np.float32) - np.float32(mean))
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+
+def _enhance_array(rgb: np.ndarray, mean: int, gamma_table: np.ndarray) -> np.ndarray:
+    """Contrast, vibrance and gamma on a chunk of rows, see enhance_colors."""
+    # chunk = autocontrast(chunk, cutoff=1)
+    chunk = _contrast_array(rgb, mean, CONTRAST_FACTOR)
+    # chunk = brightness(chunk, 1.04)
+
+    chunk = _vibrance_array(chunk, amount=VIBRANCE_AMOUNT)
+
+    return gamma_table[chunk]
+
+
+def _padded_mean(image: Image.Image) -> int:
+    """
+    Rounded mean luminance of the image once padded to the display with white,
+    as enhance_colors computes it, without building the padded image.
+    """
+    histogram = image.convert("L").histogram()
+    histogram[255] += DISPLAY_WIDTH * DISPLAY_HEIGHT - image.width * image.height
+    return int(ImageStat.Stat(histogram).mean[0] + 0.5)
 
 
 def enhance_colors(image: Image.Image) -> Image.Image:
-    img = image.convert("RGB")
+    """
+    Contrast, vibrance and gamma in a single pass over the image, processed in
+    row chunks to keep the float temporaries small.
+    """
+    img = image if image.mode == "RGB" else image.convert("RGB")
+    rgb = np.asarray(img, dtype=np.uint8)
+    out = np.empty_like(rgb)
 
-    # img = ImageOps.autocontrast(img, cutoff=1)
-    img = ImageEnhance.Contrast(img).enhance(1.05)
-    # img = ImageEnhance.Brightness(img).enhance(1.04)
+    # Contrast pivots around the mean luminance of the whole image
+    mean = int(ImageStat.Stat(img.convert("L")).mean[0] + 0.5)
+    gamma_table = np.array(_gamma_table(GAMMA), dtype=np.uint8)
 
-    img = apply_vibrance(img, amount=0.05)
+    for y in range(0, rgb.shape[0], ENHANCE_CHUNK_ROWS):
+        out[y:y + ENHANCE_CHUNK_ROWS] = _enhance_array(rgb[y:y + ENHANCE_CHUNK_ROWS], mean, gamma_table)
 
-    img = apply_gamma(img, gamma=1.13)
+    img = Image.fromarray(out, mode="RGB")
 
     # img = img.filter(ImageFilter.UnsharpMask(radius=1.1, percent=140, threshold=6))
 
@@ -103,7 +325,25 @@ def resize_for_spectra6(image):
     Returns:
         PIL.Image.Image: Resized and padded image.
     """
-    img = image.convert("RGB")  # ensure RGB
+    img_resized, x_offset, y_offset = _fit_to_display(image)
+
+    # Create white background
+    background = Image.new("RGB", (DISPLAY_WIDTH, DISPLAY_HEIGHT), (255, 255, 255))
+
+    # Paste resized image centered
+    background.paste(img_resized, (x_offset, y_offset))
+
+    return background
+
+
+def _fit_to_display(image: Image.Image) -> tuple[Image.Image, int, int]:
+    """
+    Resize to fit the display keeping the aspect ratio.
+
+    Returns:
+        tuple: (resized RGB image, x offset, y offset) of the image centered on the display
+    """
+    img = image if image.mode == "RGB" else image.convert("RGB")  # ensure RGB
 
     # Calculate aspect ratios
     img_ratio = img.width / img.height
@@ -119,18 +359,12 @@ def resize_for_spectra6(image):
         new_height = DISPLAY_HEIGHT
         new_width = round(DISPLAY_HEIGHT * img_ratio)
 
-    # Resize with high-quality resampling
-    img_resized = img.resize((new_width, new_height), Image.LANCZOS)
+    # Resize with high-quality resampling, large sources are box-reduced first
+    img_resized = img.resize((new_width, new_height), Image.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
 
-    # Create white background
-    background = Image.new("RGB", (DISPLAY_WIDTH, DISPLAY_HEIGHT), (255, 255, 255))
-
-    # Paste resized image centered
     x_offset = (DISPLAY_WIDTH - new_width) // 2
     y_offset = (DISPLAY_HEIGHT - new_height) // 2
-    background.paste(img_resized, (x_offset, y_offset))
-
-    return background
+    return img_resized, x_offset, y_offset
 
 
 def count_images(path: str, recursive: bool = False) -> int:
@@ -143,63 +377,104 @@ def count_images(path: str, recursive: bool = False) -> int:
     Returns:
         int: number of image files found
     """
-    image_extensions = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tiff"}
     count = 0
 
     if recursive:
         for root, _, files in os.walk(path):
             for file in files:
-                if os.path.splitext(file)[1].lower() in image_extensions:
+                if os.path.splitext(file)[1].lower() in IMAGE_EXTENSIONS:
                     count += 1
     else:
         for file in os.listdir(path):
-            if os.path.splitext(file)[1].lower() in image_extensions:
+            if os.path.splitext(file)[1].lower() in IMAGE_EXTENSIONS:
                 count += 1
 
     return count
 
 
-def get_random_image(path: str):
+def get_random_image_path(path: str):
     """
-    Return a single random image from the directory, along with its full path.
+    Return the full path of a single random image from the directory.
 
     Args:
         path (str): Directory to read images from
 
     Returns:
-        tuple: (PIL.Image object, full_path) or (None, None) if no images found
+        str: full path or None if no images found
     """
-    image_extensions = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tiff"}
-
     files = [
         os.path.join(path, f)
         for f in os.listdir(path)
-        if os.path.splitext(f)[1].lower() in image_extensions
+        if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS
     ]
 
     if not files:
-        return None, None
+        return None
+
+    return random.choice(files)
+
 
-    full_path = random.choice(files)
+def load_source(image_path: str) -> SourceImage | None:
+    """
+    Read an image file into memory with a single read and parse its EXIF metadata.
+
+    Args:
+        image_path (str): Path of the image to read
+
+    Returns:
+        SourceImage or None if the file could not be read
+    """
     try:
-        image = Image.open(full_path)
-        copy = image.copy()
-        image.close()
-        return copy, full_path
+        return SourceImage.read(image_path)
     except Exception as e:
-        print(f"⚠️ Failed to open {full_path}: {e}")
-        return None, None
+        logger.warning(f"Failed to open {image_path}: {e}")
+        return None
 
 
-def correct_image_orientation(image: Image.Image, image_path: str) -> Image.Image:
+def load_image(image_path: str, size: tuple[int, int] | None = (DISPLAY_WIDTH, DISPLAY_HEIGHT)):
     """
-    Rotate the image according to its EXIF Orientation tag (if available).
-    Uses piexif to support all EXIF-enabled images.
+    Load an image from disk into memory, closing the underlying file.
+
+    Args:
+        image_path (str): Path of the image to load
+        size (tuple): Display size the image will be fitted to, None for full resolution
+
+    Returns:
+        PIL.Image object or None if the image could not be opened
     """
     try:
-        exif_dict = piexif.load(image_path)
-        orientation = exif_dict.get("0th", {}).get(piexif.ImageIFD.Orientation, 1)
+        return SourceImage.read(image_path).open(size)
+    except Exception as e:
+        logger.warning(f"Failed to open {image_path}: {e}")
+        return None
+
+
+def get_random_image(path: str):
+    """
+    Return a single random image from the directory, along with its full path.
+
+    Args:
+        path (str): Directory to read images from
+
+    Returns:
+        tuple: (PIL.Image object, full_path) or (None, None) if no images found
+    """
+    full_path = get_random_image_path(path)
+    if full_path is None:
+        return None, None
+
+    image = load_image(full_path)
+    if image is None:
+        return None, None
+
+    return image, full_path
 
+
+def correct_image_orientation(image: Image.Image, orientation: int) -> Image.Image:
+    """
+    Rotate the image according to its EXIF Orientation tag value.
+    """
+    try:
         if orientation == 1:
             return image
         elif orientation == 2:
@@ -224,9 +499,9 @@ def correct_image_orientation(image: Image.Image, image_path: str) -> Image.Imag
         return image
 
 
-def add_metadata_overlay(img: Image.Image, image_path: str) -> Image.Image:
+def add_metadata_overlay(img: Image.Image, source: SourceImage) -> Image.Image:
     """
-    Reads EXIF date and GPS location from a PIL image,
+    Takes the EXIF date and GPS location parsed from the source image,
     and draws it in the bottom-right corner with two lines:
     - Date on top
     - Address (from GPS) below
@@ -246,42 +521,12 @@ def add_metadata_overlay(img: Image.Image, image_path: str) -> Image.Image:
         logger.error("Failed to load font, using system default")
         font_date = font_address = ImageFont.load_default()
 
-    date_str = ""
+    date_str = source.date
     gps_str = ""
 
-    # --- Extract EXIF ---
-    try:
-        exif_dict = piexif.load(image_path)
-
-        # Date
-        date_bytes = exif_dict["0th"].get(piexif.ImageIFD.DateTime)
-        if date_bytes:
-            date_str = date_bytes.decode("utf-8")
-
-        # GPS
-        gps_ifd = exif_dict.get("GPS", {})
-        if gps_ifd:
-            def dms_to_deg(dms, ref):
-                deg = dms[0][0] / dms[0][1]
-                min = dms[1][0] / dms[1][1]
-                sec = dms[2][0] / dms[2][1]
-                val = deg + min / 60 + sec / 3600
-                if ref in [b"S", b"W"]:
-                    val = -val
-                return val
-
-            lat = gps_ifd.get(piexif.GPSIFD.GPSLatitude)
-            lat_ref = gps_ifd.get(piexif.GPSIFD.GPSLatitudeRef)
-            lon = gps_ifd.get(piexif.GPSIFD.GPSLongitude)
-            lon_ref = gps_ifd.get(piexif.GPSIFD.GPSLongitudeRef)
-
-            if lat and lat_ref and lon and lon_ref:
-                lat_val = dms_to_deg(lat, lat_ref)
-                lon_val = dms_to_deg(lon, lon_ref)
-                gps_str = coords_to_address(lat_val, lon_val)  # your reverse geocoding function
-
-    except Exception as e:
-        logger.warning(f"Failed to read EXIF metadata: {e}")
+    if source.coordinates:
+        lat_val, lon_val = source.coordinates
+        gps_str = coords_to_address(lat_val, lon_val)  # your reverse geocoding function
 
     # --- Draw overlay if we have any text ---
     lines = []
@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from piframe.const import INGEST_WORKERS, INGEST_MAX_PENDING
+from piframe.utils.image_index import ImageIndex
+from piframe.utils.image_utils import load_source, pre_process_buffer
+from piframe.utils.metrics import UPLOADS
+from piframe.utils.render_cache import RenderCache
+from piframe.utils.upload import Upload, remove_file
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidUpload(ValueError):
+    """An uploaded file that cannot be decoded or rendered."""
+
+
+class Ingestor:
+    """
+    Turns uploaded images into display-ready collection images in the background.
+
+    Each upload is decoded (which validates it), oriented and rendered to a
+    panel buffer like the slideshow would. Only then is it moved to its final
+    name in the collection, its buffer stored in the render cache and the
+    image registered with the index, so the slideshow never sees a broken or
+    half-written file. Uploads that fail are deleted.
+
+    At most `workers` uploads are processed at once, each dithering on a
+    single thread to leave the rest of the CPU to the slideshow. No more than
+    `max_pending` uploads wait or run at a time, submit() refuses the rest.
+    """
+
+    def __init__(
+            self,
+            render_cache: RenderCache,
+            image_index: ImageIndex,
+            *,
+            workers: int = INGEST_WORKERS,
+            max_pending: int = INGEST_MAX_PENDING,
+    ):
+        self.render_cache = render_cache
+        self.image_index = image_index
+        self.max_pending = max_pending
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+
+    def full(self) -> bool:
+        with self._lock:
+            return len(self._pending) >= self.max_pending
+
+    def submit(self, upload: Upload, directory: str) -> bool:
+        """Queue an upload for ingestion into `directory`, or delete it and return False when full."""
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                remove_file(upload.tmp_path)
+                return False
+            self._pending.add(upload.tmp_path)
+
+        self._executor.submit(self._ingest, upload, directory)
+        UPLOADS.inc("accepted")
+        return True
+
+    def close(self):
+        """Finish the uploads being processed, drop the ones still waiting."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            for tmp_path in self._pending:
+                remove_file(tmp_path)
+            self._pending.clear()
+
+    def _ingest(self, upload: Upload, directory: str):
+        try:
+            buffer = _render(upload)
+
+            with self._lock:
+                path = _unique_path(directory, upload.filename)
+                os.replace(upload.tmp_path, path)
+
+            self.render_cache.put(path, buffer)
+            self.image_index.add(path)
+        except Exception as e:
+            if isinstance(e, InvalidUpload):
+                # Nothing unexpected, someone uploaded a file that is no usable image
+                logger.warning(f"Rejected upload {upload.filename}: {e}")
+            else:
+                logger.exception(f"Failed to ingest upload {upload.filename}")
+            remove_file(upload.tmp_path)
+            UPLOADS.inc("failed")
+        else:
+            logger.info(f"Ingested upload {upload.filename} as {path}")
+            UPLOADS.inc("ingested")
+        finally:
+            with self._lock:
+                self._pending.discard(upload.tmp_path)
+
+
+def _render(upload: Upload) -> bytes:
+    """Render an upload to a panel buffer, raising InvalidUpload if it cannot be decoded."""
+    source = load_source(upload.tmp_path)
+    if source is None:
+        raise InvalidUpload("unreadable")
+    try:
+        return pre_process_buffer(source, dither_threads=1)
+    # Pillow reports broken image data as any of these
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidUpload(f"not a valid image, {e}") from e
+
+
+def _unique_path(directory: str, filename: str) -> str:
+    stem, ext = os.path.splitext(filename)
+    path = os.path.join(directory, filename)
+    n = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f"{stem}-{n}{ext}")
+        n += 1
+    return path
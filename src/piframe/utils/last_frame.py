@@ -0,0 +1,37 @@
+import logging
+import os
+
+from piframe.const import LAST_FRAME_PATH, DISPLAY_WIDTH, DISPLAY_HEIGHT
+
+logger = logging.getLogger(__name__)
+
+FRAME_BYTES = DISPLAY_WIDTH * DISPLAY_HEIGHT // 2
+
+
+def save_last_frame(buffer, path: str = LAST_FRAME_PATH):
+    """Persist the packed buffer that is on the panel, replacing the previous one atomically."""
+    tmp_path = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(buffer)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to store the last frame: {e}")
+
+
+def load_last_frame(path: str = LAST_FRAME_PATH) -> bytes | None:
+    """Return the packed buffer shown before the last shutdown, or None if there is none."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Failed to read the last frame: {e}")
+        return None
+
+    if len(data) != FRAME_BYTES:
+        logger.warning(f"Ignoring last frame of {len(data)} bytes, expected {FRAME_BYTES}")
+        return None
+    return data
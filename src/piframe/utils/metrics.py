@@ -0,0 +1,192 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+# Default histogram buckets in seconds, from SPI bursts up to a full panel refresh
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """
+    A gauge whose value is read from a callable at scrape time, or set
+    explicitly when no callable is given. An unset gauge has no sample.
+    """
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float | None] | None = None):
+        self.name = name
+        self.documentation = documentation
+        self.read = read or (lambda: self._value)
+        self._value = None
+
+    def set(self, value: float):
+        self._value = value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        value = self.read()
+        if value is not None:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [bucket counts..., sum, count]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(labels)
+            if values is None:
+                values = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(values)) for labels, values in self._values.items())
+
+        for labels, values in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {values[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {values[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def process_uptime() -> float:
+    """Seconds since this process was started, including interpreter startup and imports."""
+    with open("/proc/self/stat") as f:
+        # Fields after the parenthesised command name, starttime is field 22
+        start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+    return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / CLOCK_TICKS
+
+
+def _resident_memory_bytes() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "piframe_stage_seconds",
+    "Time spent per rendering and display stage.",
+    labelnames=("stage",),
+))
+
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "piframe_cache_requests_total",
+    "Cache lookups by cache and result.",
+    labelnames=("cache", "result"),
+))
+
+FRAMES_DISPLAYED = REGISTRY.register(Counter(
+    "piframe_frames_displayed_total",
+    "Frames pushed to the panel.",
+))
+
+BUSY_POLLS = REGISTRY.register(Counter(
+    "piframe_panel_busy_polls_total",
+    "Reads of the panel busy pin while waiting for it.",
+))
+
+SLIDESHOW_COMMANDS = REGISTRY.register(Counter(
+    "piframe_slideshow_commands_total",
+    "Slideshow commands by command and whether they were coalesced into an earlier one.",
+    labelnames=("command", "result"),
+))
+
+UPLOADS = REGISTRY.register(Counter(
+    "piframe_uploads_total",
+    "Uploaded images by outcome: accepted, busy (refused, queue full), ingested or failed.",
+    labelnames=("result",),
+))
+
+TIME_TO_FIRST_FRAME = REGISTRY.register(Gauge(
+    "piframe_time_to_first_frame_seconds",
+    "Seconds from process start until the first frame was on the panel.",
+))
+
+RESIDENT_MEMORY = REGISTRY.register(Gauge(
+    "process_resident_memory_bytes",
+    "Resident memory size in bytes.",
+    _resident_memory_bytes,
+))
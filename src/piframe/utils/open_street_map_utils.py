@@ -1,6 +1,13 @@
 import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
+from piframe.const import NOMINATIM_URL, NOMINATIM_MIN_INTERVAL_SECONDS, GEOCODE_CACHE_PATH, GEOCODE_PRECISION, \
+    GEOCODE_TTL_SECONDS, GEOCODE_CACHE_MAX_ENTRIES, GEOCODE_FAILURE_TTL_SECONDS
+from piframe.utils.metrics import STAGE_SECONDS, CACHE_REQUESTS
 
 logging.basicConfig(
     level=logging.INFO,
@@ -10,12 +17,32 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def coords_to_address(lat: float, lon: float) -> str:
+class NominatimBackend:
     """
-    Reverse geocode latitude and longitude to a short English address using Nominatim.
+    Reverse geocoding through a Nominatim compatible server.
+
+    Connections are pooled in a single session and requests are spaced at
+    least `min_interval` seconds apart, as required by the public server's
+    usage policy. Point `url` at a local stand-in server for testing.
     """
-    try:
-        url = "https://nominatim.openstreetmap.org/reverse"
+
+    def __init__(self, url: str = NOMINATIM_URL, min_interval: float = NOMINATIM_MIN_INTERVAL_SECONDS):
+        # Imported here, requests is slow to import and only needed once an image has GPS data
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = url
+        self.min_interval = min_interval
+
+        self._session = requests.Session()
+        self._session.headers["User-Agent"] = "PiFrame/1.0"
+        self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self._session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+        self._lock = threading.Lock()
+        self._last_request = 0.0
+
+    def reverse(self, lat: float, lon: float) -> str:
         params = {
             "format": "jsonv2",
             "lat": lat,
@@ -24,8 +51,16 @@ def coords_to_address(lat: float, lon: float) -> str:
             "addressdetails": 1,
             "accept-language": "en"  # Force English
         }
-        headers = {"User-Agent": "PiFrame/1.0"}
-        response = requests.get(url, params=params, headers=headers, timeout=5)
+
+        with self._lock:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                response = self._session.get(self.url, params=params, timeout=5)
+            finally:
+                self._last_request = time.monotonic()
+
         response.raise_for_status()
         data = response.json()
 
@@ -36,6 +71,197 @@ def coords_to_address(lat: float, lon: float) -> str:
         )
         return short_address or data.get("display_name", "")
 
+
+class GeocodeCache:
+    """
+    Persistent cache of reverse geocoding results, keyed on quantised coordinates.
+
+    Entries older than the TTL are still served, and refreshed when possible.
+    When the cache is full the least recently used entries are evicted.
+    """
+
+    def __init__(
+            self,
+            db_path: str = GEOCODE_CACHE_PATH,
+            *,
+            ttl: float = GEOCODE_TTL_SECONDS,
+            max_entries: int = GEOCODE_CACHE_MAX_ENTRIES,
+    ):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS places ("
+            "lat INTEGER, lon INTEGER, address TEXT NOT NULL, fetched_at REAL NOT NULL, used_at REAL NOT NULL, "
+            "PRIMARY KEY (lat, lon))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS places_used_at ON places (used_at)")
+
+    @staticmethod
+    def key(lat: float, lon: float) -> tuple[int, int]:
+        scale = 10 ** GEOCODE_PRECISION
+        return round(lat * scale), round(lon * scale)
+
+    def get(self, lat: float, lon: float) -> tuple[str, bool] | None:
+        """
+        Return (address, expired) for the coordinates, or None if they were never looked up.
+        """
+        key = self.key(lat, lon)
+        now = time.time()
+
+        with self._lock, self._db:
+            row = self._db.execute("SELECT address, fetched_at FROM places WHERE lat = ? AND lon = ?", key).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE places SET used_at = ? WHERE lat = ? AND lon = ?", (now, *key))
+
+        address, fetched_at = row
+        return address, now - fetched_at > self.ttl
+
+    def put(self, lat: float, lon: float, address: str):
+        now = time.time()
+
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO places (lat, lon, address, fetched_at, used_at) VALUES (?, ?, ?, ?, ?)",
+                (*self.key(lat, lon), address, now, now),
+            )
+            self._db.execute(
+                "DELETE FROM places WHERE rowid IN (SELECT rowid FROM places ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+class Geocoder:
+    """
+    Reverse geocoding through the persistent cache.
+
+    Only coordinates that were never looked up wait for the backend. An
+    expired address is returned right away and refreshed in the background,
+    one lookup at a time, so a render of known coordinates never waits on
+    the network or the rate limit.
+
+    Coordinates whose lookup failed are not looked up again for
+    `failure_ttl` seconds. Until then a miss returns "" and an expired
+    address is served without a refresh. Failures are only kept in memory.
+    """
+
+    def __init__(
+            self,
+            backend=None,
+            cache: GeocodeCache | None = None,
+            *,
+            failure_ttl: float = GEOCODE_FAILURE_TTL_SECONDS,
+    ):
+        self.backend = backend or NominatimBackend()
+        self.cache = cache or GeocodeCache()
+        self.failure_ttl = failure_ttl
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="geocode")
+        self._refreshing: set[tuple[int, int]] = set()
+        # Quantised coordinates -> when their lookup may be tried again
+        self._failed: dict[tuple[int, int], float] = {}
+        self._lock = threading.Lock()
+
+    def address(self, lat: float, lon: float) -> str:
+        cached = self.cache.get(lat, lon)
+        if cached is not None:
+            address, expired = cached
+            CACHE_REQUESTS.inc("geocode", "expired" if expired else "hit")
+            if expired:
+                self._refresh_later(lat, lon)
+            return address
+
+        CACHE_REQUESTS.inc("geocode", "miss")
+        if self._recently_failed(lat, lon):
+            return ""
+        try:
+            return self._lookup(lat, lon)
+        except Exception as e:
+            logger.error(f"Reverse geocoding failed: {e}")
+            return ""
+
+    def _lookup(self, lat: float, lon: float) -> str:
+        try:
+            with STAGE_SECONDS.time("geocode"):
+                address = self.backend.reverse(lat, lon)
+        except Exception:
+            self._lookup_failed(lat, lon)
+            raise
+        self.cache.put(lat, lon, address)
+        return address
+
+    def _recently_failed(self, lat: float, lon: float) -> bool:
+        key = self.cache.key(lat, lon)
+        with self._lock:
+            retry_at = self._failed.get(key)
+            if retry_at is None:
+                return False
+            if time.monotonic() < retry_at:
+                return True
+            del self._failed[key]
+            return False
+
+    def _lookup_failed(self, lat: float, lon: float):
+        now = time.monotonic()
+        with self._lock:
+            # Drop the expired ones, so a long time offline doesn't grow the dict without bound
+            self._failed = {key: retry_at for key, retry_at in self._failed.items() if retry_at > now}
+            self._failed[self.cache.key(lat, lon)] = now + self.failure_ttl
+
+    def _refresh_later(self, lat: float, lon: float):
+        if self._recently_failed(lat, lon):
+            return
+        key = self.cache.key(lat, lon)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._executor.submit(self._refresh, lat, lon, key)
+
+    def _refresh(self, lat: float, lon: float, key: tuple[int, int]):
+        try:
+            self._lookup(lat, lon)
+        except Exception as e:
+            # Offline: the expired address is kept and served until a refresh succeeds
+            logger.error(f"Refreshing reverse geocoding failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+_geocoder: Geocoder | None = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder() -> Geocoder:
+    global _geocoder
+
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = Geocoder()
+        return _geocoder
+
+
+def set_geocoder(geocoder: Geocoder):
+    """Replace the geocoder used by coords_to_address, e.g. with one using a local backend."""
+    global _geocoder
+
+    with _geocoder_lock:
+        _geocoder = geocoder
+
+
+def coords_to_address(lat: float, lon: float) -> str:
+    """
+    Reverse geocode latitude and longitude to a short English address using Nominatim.
+    Cached lookups never touch the network.
+    """
+    try:
+        return get_geocoder().address(lat, lon)
     except Exception as e:
         logger.error(f"Reverse geocoding failed: {e}")
-        return ""
\ No newline at end of file
+        return ""
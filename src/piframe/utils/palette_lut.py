@@ -0,0 +1,107 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+from piframe.const import LUT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the way LUTs are built changes
+LUT_FORMAT_VERSION = 1
+
+LUT_METRICS = ("rgb", "lab")
+
+# Grid entries converted and compared per step, bounds the memory a build needs
+BUILD_CHUNK = 1 << 18
+
+
+def lut_size(bits: int) -> int:
+    return 1 << (3 * bits)
+
+
+def build_lut(palette_rgb: np.ndarray, bits: int, metric: str) -> np.ndarray:
+    """
+    Map every cell of a 2^bits per channel RGB grid to the nearest palette color.
+
+    Entry (r >> (8-bits)) << 2*bits | (g >> (8-bits)) << bits | (b >> (8-bits))
+    holds the palette index, matching the lookup in atkinson_rs.
+
+    Args:
+        palette_rgb (np.ndarray): (K,3) uint8 palette
+        bits (int): Grid resolution per channel, 5 to 8
+        metric (str): "rgb" for Euclidean RGB distance, "lab" for CIELAB (perceptual)
+    """
+    if not 5 <= bits <= 8:
+        raise ValueError(f"LUT bits must be between 5 and 8, got {bits}")
+    if metric not in LUT_METRICS:
+        raise ValueError(f"LUT metric must be one of {LUT_METRICS}, got {metric!r}")
+
+    n = 1 << bits
+    values = np.linspace(0, 255, n, dtype=np.float32)
+
+    if metric == "lab":
+        # Only needed when a LUT is actually built, keeps scikit-image off the startup path
+        from skimage.color import rgb2lab
+        from piframe.utils.color_mapping_utils import _palette_rgb_to_lab
+
+        pal = _palette_rgb_to_lab(palette_rgb)
+    else:
+        pal = palette_rgb.astype(np.float32)
+
+    lut = np.empty(lut_size(bits), dtype=np.uint8)
+    d2 = np.empty((min(BUILD_CHUNK, lut.size), len(pal)), dtype=np.float32)
+
+    for start in range(0, lut.size, BUILD_CHUNK):
+        index = np.arange(start, min(start + BUILD_CHUNK, lut.size))
+        grid = np.stack([values[index >> (2 * bits)], values[(index >> bits) & (n - 1)], values[index & (n - 1)]],
+                        axis=-1)
+        if metric == "lab":
+            grid = rgb2lab(grid / 255.0).astype(np.float32)
+
+        chunk = d2[:len(index)]
+        for i in range(len(pal)):
+            diff = grid - pal[i]
+            chunk[:, i] = np.sum(diff * diff, axis=1)
+
+        lut[start:start + len(index)] = np.argmin(chunk, axis=1)
+
+    return lut
+
+
+def load_lut(palette_rgb: np.ndarray, bits: int, metric: str, directory: str = LUT_CACHE_DIR) -> bytes:
+    """
+    Return the LUT for the palette and settings, built once and then read from disk.
+    """
+    identity = f"{LUT_FORMAT_VERSION}\0{bits}\0{metric}\0".encode("utf-8") + palette_rgb.astype(np.uint8).tobytes()
+    path = os.path.join(directory, f"{metric}{bits}-{hashlib.sha1(identity).hexdigest()[:16]}.lut")
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) == lut_size(bits):
+            return data
+        logger.warning(f"Ignoring truncated palette LUT {path}")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to read palette LUT {path}: {e}")
+
+    logger.info(f"Building {bits}-bit {metric} palette LUT, this only happens once")
+    data = build_lut(palette_rgb, bits, metric).tobytes()
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to store palette LUT {path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    return data
@@ -0,0 +1,202 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+from piframe.const import PREFETCH_DEPTH
+from piframe.utils.image_utils import get_random_image_path
+
+logger = logging.getLogger(__name__)
+
+# Wait after a failed render, doubling with every failure in a row
+FAILURE_BACKOFF_MIN_SECONDS = 1
+FAILURE_BACKOFF_MAX_SECONDS = 60
+# Images that failed to render are not tried again for this long
+FAILED_IMAGE_TTL_SECONDS = 600
+
+
+class Prefetcher:
+    """
+    Renders upcoming images in a background thread, so showing the next image
+    only has to push an already packed buffer to the display.
+
+    Candidates are picked from the current source directory. Changing the
+    source drops everything queued for the previous one. A render that is
+    still in flight for the old source gets its cancel event set, `render` is
+    expected to give up early and return None.
+
+    A render that fails, raising or returning None without being cancelled,
+    is followed by a wait that grows with every failure in a row, and the
+    image is skipped for FAILED_IMAGE_TTL_SECONDS. Picking a skipped image
+    counts as another failure, so a source of broken images is not polled
+    in a tight loop.
+    """
+
+    def __init__(
+            self,
+            render: Callable[[str, threading.Event], object],
+            *,
+            pick: Callable[[str], str | None] = get_random_image_path,
+            depth: int = PREFETCH_DEPTH,
+    ):
+        self._render = render
+        self._pick = pick
+        self._depth = depth
+
+        self._queue = deque()
+        self._source = None
+        self._generation = 0
+        self._exhausted = False
+        self._closed = False
+        self._cancel = threading.Event()
+        self._cond = threading.Condition()
+
+        # Only used by the worker thread: image path -> when to try it again
+        self._failed: dict[str, float] = {}
+        self._failures = 0
+
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def set_source(self, path: str):
+        """Switch to a new source directory, invalidating the queue."""
+        with self._cond:
+            if path == self._source:
+                return
+
+            self._source = path
+            self._generation += 1
+            self._exhausted = False
+            self._queue.clear()
+            self._cancel.set()
+            self._cancel = threading.Event()
+            self._cond.notify_all()
+
+        logger.info(f"Prefetch queue invalidated, now rendering from {path}")
+
+    def close(self):
+        """Stop prefetching, cancel the render in flight and wake up any take()."""
+        with self._cond:
+            self._closed = True
+            self._queue.clear()
+            self._cancel.set()
+            self._cond.notify_all()
+
+    def take(self):
+        """
+        Return the next (image_path, buffer, source), waiting for a render if none is ready.
+
+        `source` is the directory the frame was rendered from, so a caller can
+        tell a frame of the current source from one handed over just before a
+        switch.
+
+        Returns:
+            tuple: (image_path, buffer, source), (None, None, source) if the
+            source has no images or (None, None, None) if the prefetcher was closed
+        """
+        with self._cond:
+            while not self._queue:
+                if self._closed:
+                    return None, None, None
+                if self._exhausted:
+                    return None, None, self._source
+                self._cond.wait()
+
+            item = self._queue.popleft()
+            self._cond.notify_all()
+            return item
+
+    def peek(self):
+        """
+        Return the (image_path, buffer) that take() would return next without
+        removing or waiting for it, or (None, None) if none is ready.
+        """
+        with self._cond:
+            if not self._queue:
+                return None, None
+            image_path, buffer, _ = self._queue[0]
+            return image_path, buffer
+
+    def _run(self):
+        generation = None
+        while True:
+            with self._cond:
+                while not self._closed and (self._source is None or len(self._queue) >= self._depth):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                source = self._source
+                if generation != self._generation:
+                    # Failures of the previous source say nothing about this one
+                    self._failures = 0
+                generation = self._generation
+                cancel = self._cancel
+
+            image_path = None
+            try:
+                image_path = self._pick(source)
+                if image_path is None:
+                    with self._cond:
+                        if generation == self._generation:
+                            self._exhausted = True
+                            self._cond.notify_all()
+                        self._cond.wait(timeout=5)
+                    continue
+
+                if self._recently_failed(image_path):
+                    # Counts as a failure, in case every image left has failed
+                    self._back_off(generation)
+                    continue
+
+                logger.info(f"Prefetching {image_path}")
+                buffer = self._render(image_path, cancel)
+            except Exception:
+                logger.exception("Failed to prefetch image")
+                self._render_failed(image_path, generation)
+                continue
+
+            if buffer is None:
+                if cancel.is_set():
+                    logger.info(f"Cancelled prefetching {image_path}, source changed")
+                else:
+                    logger.warning(f"Failed to render {image_path}, skipping it for a while")
+                    self._render_failed(image_path, generation)
+                continue
+
+            self._failures = 0
+            with self._cond:
+                if generation != self._generation:
+                    logger.info(f"Discarding prefetched {image_path}, source changed")
+                    continue
+
+                self._exhausted = False
+                self._queue.append((image_path, buffer, source))
+                self._cond.notify_all()
+
+    def _recently_failed(self, image_path: str) -> bool:
+        retry_at = self._failed.get(image_path)
+        if retry_at is None:
+            return False
+        if time.monotonic() < retry_at:
+            return True
+        del self._failed[image_path]
+        return False
+
+    def _render_failed(self, image_path: str | None, generation: int):
+        if image_path is not None:
+            self._failed[image_path] = time.monotonic() + FAILED_IMAGE_TTL_SECONDS
+        self._back_off(generation)
+
+    def _back_off(self, generation: int):
+        self._failures += 1
+        self._wait(min(FAILURE_BACKOFF_MIN_SECONDS * 2 ** (self._failures - 1), FAILURE_BACKOFF_MAX_SECONDS), generation)
+
+    def _wait(self, seconds: float, generation: int):
+        """Sleep for `seconds`, cut short by a source change or close()."""
+        deadline = time.monotonic() + seconds
+        with self._cond:
+            while not self._closed and generation == self._generation:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self._cond.wait(timeout=remaining)
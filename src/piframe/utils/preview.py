@@ -0,0 +1,65 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+from piframe.utils.buffer_utils import buffer_to_image
+from piframe.utils.metrics import CACHE_REQUESTS, STAGE_SECONDS
+
+
+class PreviewCache:
+    """
+    PNG previews of packed panel buffers, in the colors of the driver palette.
+
+    Each buffer is hashed and encoded once, later requests for the same buffer
+    object only cost a lookup. Buffers are kept alive while they are cached,
+    so a cached entry can never be confused with a new buffer at the same
+    address. Identical frames in different buffers share their PNG.
+    """
+
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, tuple[object, str, bytes]] = OrderedDict()
+        # Also serialises encoding, so concurrent requests for a new frame encode it once
+        self._lock = threading.Lock()
+
+    def get(self, buffer) -> tuple[str, bytes]:
+        """Return (etag, png) for the buffer."""
+        with self._lock:
+            entry = self._entries.get(id(buffer))
+            if entry is not None and entry[0] is buffer:
+                self._entries.move_to_end(id(buffer))
+                CACHE_REQUESTS.inc("preview", "hit")
+                return entry[1], entry[2]
+
+            CACHE_REQUESTS.inc("preview", "miss")
+            etag = hashlib.sha1(buffer).hexdigest()
+            png = next((png for _, other, png in self._entries.values() if other == etag), None)
+            if png is None:
+                with STAGE_SECONDS.time("preview_encode"):
+                    out = io.BytesIO()
+                    buffer_to_image(buffer).save(out, format="PNG")
+                    png = out.getvalue()
+
+            self._entries[id(buffer)] = (buffer, etag, png)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return etag, png
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches the (unquoted) etag, using the weak
+    comparison it calls for: any listed tag, weak or strong, or "*".
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"') == etag:
+            return True
+    return False
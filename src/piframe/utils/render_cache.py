@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+
+from piframe.const import RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES, DISPLAY_WIDTH, DISPLAY_HEIGHT, \
+    SPECTRA6_DITHER_PALETTE, SPECTRA6_DRIVER_PALETTE, DITHER_TO_DRIVER, CONTRAST_FACTOR, VIBRANCE_AMOUNT, GAMMA, \
+    DITHER_SERPENTINE, RESIZE_REDUCING_GAP, DITHER_LUT_BITS, DITHER_LUT_METRIC
+from piframe.utils.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the layout of the stored buffers changes
+CACHE_FORMAT_VERSION = 2
+
+ENTRY_SUFFIX = ".bin"
+
+
+def pipeline_fingerprint() -> str:
+    """
+    Hash of every setting that influences the rendered panel buffer.
+    Changing any of them invalidates all previously cached renders.
+    """
+    params = {
+        "format": CACHE_FORMAT_VERSION,
+        "size": [DISPLAY_WIDTH, DISPLAY_HEIGHT],
+        "decode": "draft",
+        "reducing_gap": RESIZE_REDUCING_GAP,
+        "dither_palette": list(SPECTRA6_DITHER_PALETTE),
+        "driver_palette": list(SPECTRA6_DRIVER_PALETTE),
+        "dither_to_driver": DITHER_TO_DRIVER.tolist(),
+        "contrast": CONTRAST_FACTOR,
+        "vibrance": VIBRANCE_AMOUNT,
+        "gamma": GAMMA,
+        "serpentine": DITHER_SERPENTINE,
+        "lut_bits": DITHER_LUT_BITS,
+        "lut_metric": DITHER_LUT_METRIC,
+    }
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """
+    On-disk cache of fully rendered 4bpp panel buffers.
+
+    Entries are keyed by the source file identity (path, size, mtime) and the
+    pipeline fingerprint. The total size is bounded, the least recently used
+    entries are evicted first. Recency is tracked through the entry's mtime,
+    so it survives restarts.
+    """
+
+    def __init__(self, directory: str = RENDER_CACHE_DIR, max_bytes: int = RENDER_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fingerprint = pipeline_fingerprint()
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._total_bytes = sum(size for _, _, size in self._entries())
+
+    def key(self, image_path: str) -> str | None:
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+
+        identity = f"{os.path.abspath(image_path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0{self.fingerprint}"
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def contains(self, image_path: str) -> bool:
+        """Whether an up to date render of the image is cached, without counting as a use."""
+        key = self.key(image_path)
+        return key is not None and os.path.exists(self._entry_path(key))
+
+    def get(self, image_path: str) -> mmap.mmap | None:
+        """
+        Return a read-only memory map of the cached buffer, or None on a miss.
+        """
+        key = self.key(image_path)
+        if key is None:
+            CACHE_REQUESTS.inc("render", "miss")
+            return None
+
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # Mark as recently used
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            CACHE_REQUESTS.inc("render", "miss")
+            return None
+
+        CACHE_REQUESTS.inc("render", "hit")
+        logger.debug(f"Render cache hit for {image_path}")
+        return buffer
+
+    def put(self, image_path: str, buffer) -> None:
+        key = self.key(image_path)
+        if key is None:
+            return
+
+        data = bytes(buffer)
+        entry_path = self._entry_path(key)
+        tmp_path = f"{entry_path}.{threading.get_ident()}.tmp"
+
+        with self._lock:
+            try:
+                old_size = os.path.getsize(entry_path)
+            except OSError:
+                old_size = 0
+
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, entry_path)
+            except OSError as e:
+                logger.warning(f"Failed to write render cache entry for {image_path}: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                return
+
+            self._total_bytes += len(data) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def _entries(self):
+        """Yield (path, mtime, size) for every cache entry."""
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(ENTRY_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield entry.path, stat.st_mtime, stat.st_size
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        self._total_bytes = sum(size for _, _, size in entries)
+
+        for path, _, size in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._total_bytes -= size
+            logger.debug(f"Evicted render cache entry {path}")
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+from enum import Enum
+
+from piframe.const import IMAGE_DELAY_SECONDS, LAST_FRAME_PATH, ImageCollection
+from piframe.utils.last_frame import load_last_frame, save_last_frame
+from piframe.utils.metrics import SLIDESHOW_COMMANDS, TIME_TO_FIRST_FRAME, process_uptime
+from piframe.utils.prefetch import Prefetcher
+
+logger = logging.getLogger(__name__)
+
+# How long to wait before looking again when the collection has no images
+EMPTY_RETRY_SECONDS = 5
+
+
+class Command(Enum):
+    NEXT = "next"
+    SET_COLLECTION = "set_collection"
+
+
+class Slideshow:
+    """
+    Runs the slideshow on the event loop of the app.
+
+    Endpoints only put commands on a queue, so they return right away. A single
+    task applies them in order and owns the slideshow state:
+
+    - A burst of NEXT commands collapses into one advance. Commands that
+      arrive while the next frame is already being fetched or drawn count
+      as one more advance, however many there are.
+    - SET_COLLECTION switches the prefetcher right away, which cancels the
+      render in flight for the old collection, and advances to the new one.
+
+    Nothing blocking runs on the loop. Renders happen on the prefetcher
+    thread, drawing on the panel thread of the EPD, whose futures are awaited.
+    The next frame is rendered while the panel is still refreshing.
+
+    Every frame drawn is saved to `last_frame_path`. On start that frame is
+    redrawn right away, without rendering, and the slideshow continues
+    after the usual delay.
+    """
+
+    def __init__(
+            self,
+            screen,
+            prefetcher: Prefetcher,
+            collection: ImageCollection = ImageCollection.DEFAULT,
+            *,
+            last_frame_path: str = LAST_FRAME_PATH,
+    ):
+        self.screen = screen
+        self.prefetcher = prefetcher
+        self.collection = collection
+        self.last_frame_path = last_frame_path
+
+        # Packed buffer of the frame on the panel
+        self.current_frame = None
+
+        self._commands: asyncio.Queue | None = None
+        self._advance: asyncio.Event | None = None
+        self._command_task: asyncio.Task | None = None
+        self._run_task: asyncio.Task | None = None
+
+    async def start(self):
+        self._commands = asyncio.Queue()
+        self._advance = asyncio.Event()
+
+        self.prefetcher.set_source(self.collection.path())
+        self._command_task = asyncio.create_task(self._handle_commands())
+        self._run_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the slideshow and put the display to sleep once it is done drawing."""
+        running = not self._run_task.done()
+
+        self._command_task.cancel()
+        self._run_task.cancel()
+        self.prefetcher.close()
+        await asyncio.gather(self._command_task, self._run_task, return_exceptions=True)
+
+        # After a failure the display was already put to sleep
+        if running:
+            logger.info("Going to sleep...")
+            await asyncio.to_thread(self.screen.sleep)
+
+    def next(self):
+        """Queue a switch to the next image. Must be called from the event loop."""
+        self._commands.put_nowait((Command.NEXT, None))
+
+    def set_collection(self, collection: ImageCollection):
+        """Queue a switch to another collection. Must be called from the event loop."""
+        self._commands.put_nowait((Command.SET_COLLECTION, collection))
+
+    async def _handle_commands(self):
+        while True:
+            batch = [await self._commands.get()]
+            while not self._commands.empty():
+                batch.append(self._commands.get_nowait())
+
+            collection = None
+            advancing = self._advance.is_set()
+            for command, arg in batch:
+                if command is Command.SET_COLLECTION:
+                    # Only the last switch counts
+                    SLIDESHOW_COMMANDS.inc(command.value, "coalesced" if collection is not None else "applied")
+                    collection = arg
+                else:
+                    SLIDESHOW_COMMANDS.inc(command.value, "coalesced" if advancing else "applied")
+                advancing = True
+
+            if collection is not None:
+                self.collection = collection
+                self.prefetcher.set_source(collection.path())
+                logger.info(f"Switched image collection to {collection.name}")
+
+            self._advance.set()
+
+    async def _wait_for_advance(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._advance.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _draw(self, buffer, *, save: bool = True):
+        busy = await asyncio.wrap_future(self.screen.display(buffer))
+        logger.info(f"Frame drawn, panel busy for {busy:.1f}s")
+        self.current_frame = buffer
+
+        if TIME_TO_FIRST_FRAME.read() is None:
+            TIME_TO_FIRST_FRAME.set(process_uptime())
+            logger.info(f"First frame on the panel {TIME_TO_FIRST_FRAME.read():.1f}s after start")
+
+        if save:
+            await asyncio.to_thread(save_last_frame, buffer, self.last_frame_path)
+
+    async def _run(self):
+        try:
+            logger.info("PiFrame started, initializing display")
+            await asyncio.to_thread(self.screen.Init)
+
+            last_frame = await asyncio.to_thread(load_last_frame, self.last_frame_path)
+            if last_frame is not None:
+                logger.info("Redrawing the last frame from before the restart")
+                await self._draw(last_frame, save=False)
+                await self._wait_for_advance(IMAGE_DELAY_SECONDS)
+            else:
+                await asyncio.wrap_future(self.screen.Clear())
+
+            while True:
+                # Everything asked for up to now is answered by the frame fetched
+                # next, what arrives from here on counts as one more advance
+                self._advance.clear()
+                image_path, buffer, source = await asyncio.to_thread(self.prefetcher.take)
+                if source is None:
+                    # The prefetcher was closed, the slideshow is stopping
+                    return
+                if source != self.collection.path():
+                    # Handed over just before a switch, it belongs to the old collection
+                    continue
+
+                if image_path is None:
+                    logger.info(f"No images found, waiting {EMPTY_RETRY_SECONDS} seconds")
+                    await self._wait_for_advance(EMPTY_RETRY_SECONDS)
+                    continue
+
+                logger.info(f"Drawing next image: {image_path}")
+                # Only current_frame keeps the buffer from here on
+                await self._draw(buffer)
+                del buffer
+
+                logger.info(f"Done, waiting {IMAGE_DELAY_SECONDS} seconds")
+                await self._wait_for_advance(IMAGE_DELAY_SECONDS)
+        except Exception:
+            logger.exception("Encountered error, going to sleep")
+            await asyncio.to_thread(self.screen.sleep)
@@ -0,0 +1,227 @@
+import io
+import logging
+import math
+
+from PIL import Image
+
+from piframe.const import DISPLAY_WIDTH, DISPLAY_HEIGHT, RESIZE_REDUCING_GAP
+from piframe.utils.strip_decode import strip_reader
+
+logger = logging.getLogger(__name__)
+
+# Modes Image.reduce() works on, others are converted to RGB first
+REDUCIBLE_MODES = {"L", "LA", "La", "RGB", "RGBA", "RGBa", "RGBX", "CMYK", "YCbCr", "PA", "I", "F"}
+# Decoded pixels per strip when an image is reduced strip by strip, and the
+# memory a strip takes at most with its converted and compressed copies
+STRIP_BYTES = 2 * 1024 * 1024
+STRIP_PEAK_BYTES = 5 * STRIP_BYTES
+
+
+class SourceImage:
+    """
+    A source image file read into memory with a single read.
+
+    EXIF orientation, date and GPS position are parsed once from the same
+    bytes that are later handed to Pillow, so the file is never opened twice.
+    """
+
+    def __init__(self, path: str, data: bytes):
+        self.path = path
+        self.data = data
+
+        self.orientation = 1
+        self.date = ""
+        self.coordinates: tuple[float, float] | None = None
+        self._parse_exif()
+
+    @classmethod
+    def read(cls, path: str) -> "SourceImage":
+        with open(path, "rb") as f:
+            return cls(path, f.read())
+
+    def open(
+            self,
+            size: tuple[int, int] | None = (DISPLAY_WIDTH, DISPLAY_HEIGHT),
+            max_bytes: int | None = None,
+    ) -> Image.Image:
+        """
+        Decode the image.
+
+        JPEGs are decoded at the smallest DCT scale (1/2, 1/4 or 1/8) that still
+        covers the given display size once fitted, which is much faster and lighter
+        than decoding a full resolution camera image.
+
+        With `max_bytes`, the source bytes, the decoded pixels and the upright
+        RGB copy made of them are kept under that many bytes. Images that would
+        need more are brought down first: JPEGs are decoded at a smaller DCT
+        scale. Everything else is box-reduced strip by strip, while it is
+        decoded where the format allows it (see strip_decode), otherwise after
+        a plain decode. Only images that do not fit either way are refused.
+
+        Args:
+            size (tuple): Display size the image will be fitted to, None for full resolution
+            max_bytes (int): Memory the decode may use, including the source bytes
+
+        Raises:
+            ValueError: if the image cannot be decoded within `max_bytes`
+        """
+        image = Image.open(io.BytesIO(self.data))
+        if size is not None:
+            target = self._draft_size(image, size)
+            image.draft("RGB", target)
+
+        if max_bytes is None:
+            image.load()
+            return image
+
+        budget = max_bytes - len(self.data)
+        if size is not None and image.format == "JPEG":
+            # Each halving of the requested size gives the next DCT scale, down to 1/8
+            while self.decoded_bytes(image) > budget and min(target) > 1:
+                target = (max(target[0] // 2, 1), max(target[1] // 2, 1))
+                smaller = Image.open(io.BytesIO(self.data))
+                smaller.draft("RGB", target)
+                if smaller.size == image.size:
+                    break
+                image = smaller
+
+        if self.decoded_bytes(image) <= budget:
+            image.load()
+            return image
+
+        read = strip_reader(image, self.data)
+        streamed = read is not None
+        factor = self._reduce_factor(image, size, budget, streamed)
+        if factor is None:
+            raise ValueError(
+                f"{self.path} is {image.width}x{image.height}, decoding it needs more than the "
+                f"{max_bytes / 2 ** 20:.0f}MB allowed"
+            )
+
+        logger.info(f"Reducing {self.path} ({image.width}x{image.height}) by {factor} while decoding, "
+                    f"to stay within the memory ceiling")
+        if not streamed:
+            image.load()
+            read = lambda y, rows: image.crop((0, y, image.width, y + rows))
+        return _reduce_strips(image, read, factor)
+
+    def decoded_bytes(self, image: Image.Image, factor: int = 1, streamed: bool = False) -> int:
+        """
+        Memory the decoded pixels take, plus the rotated and RGB converted
+        copies made of them.
+
+        With a `factor`, the copies are made of the image reduced by it, which
+        is built a strip at a time next to the full decode, or next to just
+        the strip when it is `streamed` from the source.
+        """
+        bands, mode = len(image.getbands()), image.mode
+        if factor == 1:
+            return self._copies_bytes(image.width * image.height, bands, mode)
+
+        needed = STRIP_PEAK_BYTES if streamed else image.width * image.height * bands + STRIP_PEAK_BYTES
+        if mode not in REDUCIBLE_MODES:
+            bands, mode = 3, "RGB"
+        reduced = math.ceil(image.width / factor) * math.ceil(image.height / factor)
+        return needed + self._copies_bytes(reduced, bands, mode)
+
+    def _copies_bytes(self, pixels: int, bands: int, mode: str) -> int:
+        needed = pixels * bands
+        if self.orientation != 1:
+            # Flipping or rotating makes a second copy next to the original
+            needed += pixels * bands
+        if mode != "RGB":
+            needed += pixels * 3
+        return needed
+
+    def _reduce_factor(
+            self,
+            image: Image.Image,
+            size: tuple[int, int] | None,
+            budget: int,
+            streamed: bool,
+    ) -> int | None:
+        """
+        Smallest integer factor that brings the decode within `budget`, but no
+        less than the box reduction the resize would do anyway. None if no
+        factor does.
+        """
+        factor = 2
+        if size is not None:
+            target_width, target_height = self._draft_size(image, size)
+            factor = max(factor, int(min(image.width / target_width, image.height / target_height)
+                                     / RESIZE_REDUCING_GAP))
+
+        while self.decoded_bytes(image, factor, streamed) > budget:
+            if factor >= max(image.width, image.height):
+                return None
+            factor += 1
+        return factor
+
+    def _draft_size(self, image: Image.Image, size: tuple[int, int]) -> tuple[int, int]:
+        """
+        Size the stored image needs to keep to still cover `size` after being
+        rotated upright and fitted to it.
+        """
+        target_width, target_height = size
+
+        # Orientations 5-8 are rotated by 90 degrees
+        if self.orientation in (5, 6, 7, 8):
+            target_width, target_height = target_height, target_width
+
+        scale = min(target_width / image.width, target_height / image.height)
+        return math.ceil(image.width * scale), math.ceil(image.height * scale)
+
+    def _parse_exif(self):
+        import piexif
+
+        try:
+            exif_dict = piexif.load(self.data)
+        except Exception as e:
+            logger.debug(f"No EXIF metadata in {self.path}: {e}")
+            return
+
+        try:
+            self.orientation = exif_dict.get("0th", {}).get(piexif.ImageIFD.Orientation, 1)
+
+            # Date
+            date_bytes = exif_dict.get("0th", {}).get(piexif.ImageIFD.DateTime)
+            if date_bytes:
+                self.date = date_bytes.decode("utf-8")
+
+            # GPS
+            gps_ifd = exif_dict.get("GPS", {})
+            if gps_ifd:
+                lat = gps_ifd.get(piexif.GPSIFD.GPSLatitude)
+                lat_ref = gps_ifd.get(piexif.GPSIFD.GPSLatitudeRef)
+                lon = gps_ifd.get(piexif.GPSIFD.GPSLongitude)
+                lon_ref = gps_ifd.get(piexif.GPSIFD.GPSLongitudeRef)
+
+                if lat and lat_ref and lon and lon_ref:
+                    self.coordinates = (_dms_to_deg(lat, lat_ref), _dms_to_deg(lon, lon_ref))
+        except Exception as e:
+            logger.warning(f"Failed to read EXIF metadata: {e}")
+
+
+def _reduce_strips(image: Image.Image, read, factor: int) -> Image.Image:
+    """Box-reduce an image by `factor`, reading it through `read(y, rows)` a strip at a time."""
+    mode = image.mode if image.mode in REDUCIBLE_MODES else "RGB"
+    reduced = Image.new(mode, (math.ceil(image.width / factor), math.ceil(image.height / factor)))
+
+    # Whole blocks of `factor` rows, so no block is split between strips
+    rows = factor * max(1, STRIP_BYTES // (image.width * len(image.getbands()) * factor))
+    for y in range(0, image.height, rows):
+        strip = read(y, min(rows, image.height - y))
+        if strip.mode != mode:
+            strip = strip.convert(mode)
+        reduced.paste(strip.reduce(factor), (0, y // factor))
+    return reduced
+
+
+def _dms_to_deg(dms, ref) -> float:
+    deg = dms[0][0] / dms[0][1]
+    minutes = dms[1][0] / dms[1][1]
+    sec = dms[2][0] / dms[2][1]
+    val = deg + minutes / 60 + sec / 3600
+    if ref in [b"S", b"W"]:
+        val = -val
+    return val
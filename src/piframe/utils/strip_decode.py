@@ -0,0 +1,136 @@
+import io
+import struct
+import zlib
+from typing import Callable, Iterator
+
+from PIL import Image
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Samples per pixel of the 8 bit PNG color types: gray, RGB, palette, gray + alpha, RGBA
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# Chunks a strip needs besides its pixels
+PNG_STRIP_CHUNKS = (b"PLTE", b"tRNS")
+
+
+def strip_reader(image: Image.Image, data: bytes) -> Callable[[int, int], Image.Image] | None:
+    """
+    Reader that decodes an image a few rows at a time, without ever holding
+    all of its pixels, or None if its format does not allow that.
+
+    Supported are 8 bit, non-interlaced PNGs and uncompressed raw images
+    (BMP, PPM and plain TIFF). `image` is the unloaded image opened from `data`.
+
+    Returns:
+        callable: read(y, rows) returns rows y to y + rows as an image. Rows
+        must be read top to bottom, without gaps.
+    """
+    if image.format == "PNG":
+        return _png_reader(image, data)
+    return _raw_reader(image, data)
+
+
+def _raw_reader(image: Image.Image, data: bytes):
+    tiles = []
+    for tile in image.tile:
+        args = (tile.args, 0, 1) if isinstance(tile.args, str) else tuple(tile.args)
+        x0, y0, x1, y1 = tile.extents
+        if tile.codec_name != "raw" or len(args) != 3 or (x0, x1) != (0, image.width):
+            return None
+
+        rawmode, stride, orientation = args
+        if stride == 0:
+            if rawmode != image.mode or image.mode == "1":
+                return None
+            stride = image.width * len(Image.new(image.mode, (1, 1)).tobytes())
+        if orientation not in (1, -1) or tile.offset + (y1 - y0) * stride > len(data):
+            return None
+        tiles.append((y0, y1, tile.offset, rawmode, stride, orientation))
+
+    if not tiles:
+        return None
+
+    def read(y: int, rows: int) -> Image.Image:
+        strip = Image.new(image.mode, (image.width, rows))
+        for y0, y1, offset, rawmode, stride, orientation in tiles:
+            top, bottom = max(y, y0), min(y + rows, y1)
+            if top >= bottom:
+                continue
+            # Bottom-up tiles store their last row first
+            first = top - y0 if orientation == 1 else y1 - bottom
+            start = offset + first * stride
+            piece = Image.frombuffer(image.mode, (image.width, bottom - top),
+                                     data[start:start + (bottom - top) * stride], "raw", rawmode, stride, orientation)
+            strip.paste(piece, (0, top - y))
+        return strip
+
+    return read
+
+
+def _png_reader(image: Image.Image, data: bytes):
+    """
+    PNG rows are inflated with zlib as they are needed, and every strip is
+    decoded by Pillow as a PNG of its own. The row above the strip is
+    prepended unfiltered, since the strip's filters refer to it.
+    """
+    chunks = list(_png_chunks(data))
+    if not chunks or chunks[0][0] != b"IHDR":
+        return None
+
+    width, height, depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", chunks[0][1])
+    if depth != 8 or interlace != 0 or color_type not in PNG_CHANNELS:
+        return None
+
+    row_bytes = width * PNG_CHANNELS[color_type]
+    extra = b"".join(_png_chunk(kind, body) for kind, body in chunks if kind in PNG_STRIP_CHUNKS)
+    idat = (body for kind, body in chunks if kind == b"IDAT")
+    inflater = zlib.decompressobj()
+    above = None
+
+    def inflate(size: int) -> bytes:
+        out = bytearray()
+        while len(out) < size:
+            pending = inflater.unconsumed_tail or next(idat, None)
+            if pending is None:
+                raise ValueError("Truncated PNG image data")
+            out += inflater.decompress(pending, size - len(out))
+        return bytes(out)
+
+    def read(y: int, rows: int) -> Image.Image:
+        nonlocal above
+        filtered = inflate(rows * (1 + row_bytes))
+
+        # A filter type 0 row is stored as is
+        seed = b"" if above is None else b"\x00" + above
+        total = rows + (above is not None)
+        header = struct.pack(">IIBBBBB", width, total, depth, color_type, 0, 0, 0)
+        png = (PNG_SIGNATURE + _png_chunk(b"IHDR", header) + extra
+               + _png_chunk(b"IDAT", zlib.compress(seed + filtered, 1)) + _png_chunk(b"IEND", b""))
+
+        strip = Image.open(io.BytesIO(png))
+        strip.load()
+        if above is not None:
+            strip = strip.crop((0, 1, width, total))
+        above = strip.crop((0, rows - 1, width, rows)).tobytes()
+        if len(above) != row_bytes:
+            raise ValueError(f"Unexpected {strip.mode} PNG strip")
+        return strip
+
+    return read
+
+
+def _png_chunks(data: bytes) -> Iterator[tuple[bytes, memoryview]]:
+    if not data.startswith(PNG_SIGNATURE):
+        return
+    view = memoryview(data)
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", view[pos:pos + 8])
+        yield kind, view[pos + 8:pos + 8 + length]
+        if kind == b"IEND":
+            return
+        pos += 12 + length
+
+
+def _png_chunk(kind: bytes, body) -> bytes:
+    return struct.pack(">I", len(body)) + kind + bytes(body) + struct.pack(">I", zlib.crc32(body, zlib.crc32(kind)))
+
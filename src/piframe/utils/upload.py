@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import os
+import re
+import uuid
+from dataclasses import dataclass
+from typing import Callable
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from piframe.const import IMAGE_EXTENSIONS, UPLOAD_MAX_BYTES, UPLOAD_MAX_FILES, UPLOAD_MAX_REQUEST_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Uploads are written next to their final place, under a name the image index ignores
+PART_PREFIX = ".upload-"
+PART_SUFFIX = ".part"
+
+
+class UploadLimitExceeded(ValueError):
+    """A request body is larger than one request may be."""
+
+
+@dataclass
+class Upload:
+    filename: str
+    tmp_path: str
+    size: int = 0
+
+
+def safe_filename(filename: str) -> str | None:
+    """Plain file name for an uploaded image, or None if it has no image extension."""
+    name = os.path.basename(filename.replace("\\", "/"))
+    stem, ext = os.path.splitext(name)
+    if ext.lower() not in IMAGE_EXTENSIONS:
+        return None
+    stem = re.sub(r"[^A-Za-z0-9._-]+", "_", stem).strip("._") or "image"
+    return stem + ext.lower()
+
+
+class _UploadWriter:
+    """
+    Multipart callbacks that write every file part to its own temporary file
+    in `directory`, chunk by chunk as the parser produces them. Each finished
+    file is handed to `submit` right away.
+
+    A file part is only written while `has_room()` says it can still be
+    taken and fewer than `max_files` came before it, others are skipped.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            submit: Callable[[Upload], bool],
+            has_room: Callable[[], bool],
+            max_bytes: int,
+            max_files: int,
+    ):
+        self.directory = directory
+        self.submit = submit
+        self.has_room = has_room
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+
+        self.accepted: list[Upload] = []
+        self.rejected: list[dict] = []
+        self.files = 0
+
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: dict[bytes, bytes] = {}
+        self._upload: Upload | None = None
+        self._file = None
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = options.get(b"filename")
+        if filename is None:
+            # Not a file, e.g. a plain form field
+            return
+
+        filename = filename.decode("utf-8", errors="replace")
+        self.files += 1
+        if self.files > self.max_files:
+            # Reported once, so the response stays small however many follow
+            if self.files == self.max_files + 1:
+                self.rejected.append({"filename": filename, "reason": f"too many files, at most {self.max_files}"})
+            return
+
+        name = safe_filename(filename)
+        if name is None:
+            self.rejected.append({"filename": filename, "reason": "not an image"})
+            return
+        if not self.has_room():
+            self.rejected.append({"filename": name, "reason": "busy"})
+            return
+
+        tmp_path = os.path.join(self.directory, f"{PART_PREFIX}{uuid.uuid4().hex}{PART_SUFFIX}")
+        self._upload = Upload(name, tmp_path)
+        self._file = open(tmp_path, "wb")
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._file is None:
+            return
+
+        self._upload.size += end - start
+        if self._upload.size > self.max_bytes:
+            self.rejected.append({"filename": self._upload.filename, "reason": "too large"})
+            self._discard()
+            return
+        self._file.write(data[start:end])
+
+    def on_part_end(self):
+        if self._file is None:
+            return
+
+        self._file.close()
+        upload, self._file, self._upload = self._upload, None, None
+        if self.submit(upload):
+            self.accepted.append(upload)
+        else:
+            self.rejected.append({"filename": upload.filename, "reason": "busy"})
+
+    def abort(self):
+        """Remove the file being written, after a failed or interrupted request."""
+        self._discard()
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+            remove_file(self._upload.tmp_path)
+        self._file = self._upload = None
+
+
+def remove_file(path: str):
+    """Delete a file, ignoring that it may already be gone."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+async def receive_uploads(
+        request: Request,
+        directory: str,
+        submit: Callable[[Upload], bool],
+        *,
+        has_room: Callable[[], bool] = lambda: True,
+        max_bytes: int = UPLOAD_MAX_BYTES,
+        max_files: int = UPLOAD_MAX_FILES,
+        max_total_bytes: int = UPLOAD_MAX_REQUEST_BYTES,
+) -> tuple[list[Upload], list[dict]]:
+    """
+    Stream the image files of a multipart/form-data request into temporary
+    files in `directory`, without holding any file in memory.
+
+    Parsing and writing run on a worker thread, one received chunk at a time.
+    Every complete file is passed to `submit`, which takes ownership of it
+    and returns whether it was accepted. Files without an image extension,
+    over `max_bytes`, past the first `max_files` or arriving while
+    `has_room()` is False are skipped without being stored.
+
+    Returns:
+        tuple: (accepted, rejected), the submitted files and a
+        {"filename", "reason"} entry for skipped ones
+
+    Raises:
+        UploadLimitExceeded: once the body exceeds `max_total_bytes`. Files
+            submitted before that are kept
+        ValueError: if the request is not multipart/form-data
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise ValueError("Expected a multipart/form-data request")
+
+    too_large = UploadLimitExceeded(f"Request too large, at most {max_total_bytes // 2 ** 20}MB")
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_total_bytes:
+        raise too_large
+
+    os.makedirs(directory, exist_ok=True)
+    writer = _UploadWriter(directory, submit, has_room, max_bytes, max_files)
+    parser = MultipartParser(boundary, writer.callbacks())
+
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_total_bytes:
+                raise too_large
+            if chunk:
+                await asyncio.to_thread(parser.write, chunk)
+        parser.finalize()
+    except BaseException:
+        writer.abort()
+        raise
+
+    logger.info(f"Received {len(writer.accepted)} upload(s) into {directory}, {len(writer.rejected)} rejected")
+    return writer.accepted, writer.rejected
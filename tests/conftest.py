@@ -0,0 +1,20 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Settings are read once, when piframe.const is imported: use the simulated
+# panel without delays, and derive the cache paths from a scratch directory
+# instead of the working directory.
+os.environ.setdefault("PIFRAME_EPD_BACKEND", "simulator")
+os.environ.setdefault("PIFRAME_SIMULATOR_TIME_SCALE", "0")
+
+_workdir = tempfile.mkdtemp(prefix="piframe-tests-")
+atexit.register(shutil.rmtree, _workdir, ignore_errors=True)
+
+_cwd = os.getcwd()
+os.chdir(_workdir)
+try:
+    import piframe.const  # noqa: F401
+finally:
+    os.chdir(_cwd)
@@ -0,0 +1,63 @@
+import pytest
+
+from piframe.utils import open_street_map_utils
+from piframe.utils.open_street_map_utils import GeocodeCache, Geocoder
+
+
+class Backend:
+    def __init__(self, address: str | None = None):
+        self.address = address
+        self.calls = 0
+
+    def reverse(self, lat: float, lon: float) -> str:
+        self.calls += 1
+        if self.address is None:
+            raise ConnectionError("offline")
+        return self.address
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(open_street_map_utils.time, "monotonic", lambda: now[0])
+    return now
+
+
+def geocoder(tmp_path, backend: Backend) -> Geocoder:
+    return Geocoder(backend, GeocodeCache(str(tmp_path / "geocode.sqlite")), failure_ttl=60)
+
+
+def test_caches_found_address(tmp_path):
+    backend = Backend("Road, City, Country")
+    geo = geocoder(tmp_path, backend)
+
+    assert geo.address(52.1, 4.3) == "Road, City, Country"
+    assert geo.address(52.1, 4.3) == "Road, City, Country"
+    assert backend.calls == 1
+
+
+def test_failed_lookup_is_not_retried_within_ttl(tmp_path, clock):
+    backend = Backend()
+    geo = geocoder(tmp_path, backend)
+
+    assert geo.address(52.1, 4.3) == ""
+    clock[0] += 59
+    assert geo.address(52.1, 4.3) == ""
+    assert backend.calls == 1
+
+    # Other coordinates are still looked up
+    assert geo.address(48.8, 2.3) == ""
+    assert backend.calls == 2
+
+
+def test_failed_lookup_is_retried_after_ttl(tmp_path, clock):
+    backend = Backend()
+    geo = geocoder(tmp_path, backend)
+    assert geo.address(52.1, 4.3) == ""
+
+    clock[0] += 61
+    backend.address = "Road, City, Country"
+
+    assert geo.address(52.1, 4.3) == "Road, City, Country"
+    assert backend.calls == 2
+    assert geo._failed == {}
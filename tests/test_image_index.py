@@ -0,0 +1,39 @@
+import shutil
+
+import pytest
+
+from piframe.utils.image_index import ImageIndex
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "images"
+    (root / "trip").mkdir(parents=True)
+    (root / "a.jpg").write_bytes(b"a")
+    (root / "trip" / "b.jpg").write_bytes(b"b")
+    return root
+
+
+@pytest.fixture
+def index(tmp_path):
+    return ImageIndex(str(tmp_path / "library.sqlite"))
+
+
+def test_recursive_listing(index, library):
+    assert index.images(str(library), recursive=True) == [str(library / "a.jpg"), str(library / "trip" / "b.jpg")]
+    assert index.images(str(library)) == [str(library / "a.jpg")]
+
+
+def test_directory_indexed_before_its_parent_gets_its_parent(index, library):
+    trip = library / "trip"
+    assert index.images(str(trip)) == [str(trip / "b.jpg")]
+    assert index.count(str(library), recursive=True) == 2
+
+    # Only reached through its parent when the parent was recorded
+    (trip / "c.jpg").write_bytes(b"c")
+    assert index.images(str(library), recursive=True) == [
+        str(library / "a.jpg"), str(trip / "b.jpg"), str(trip / "c.jpg"),
+    ]
+
+    shutil.rmtree(trip)
+    assert index.images(str(library), recursive=True) == [str(library / "a.jpg")]
@@ -0,0 +1,20 @@
+import pytest
+
+from piframe.utils.preview import etag_matches
+
+
+@pytest.mark.parametrize("if_none_match, expected", [
+    ('"abc"', True),
+    ('"old", "abc"', True),
+    ('"old","abc" , "other"', True),
+    ('W/"abc"', True),
+    ('"old", W/"abc"', True),
+    ("*", True),
+    ('"old"', False),
+    ('"old", W/"other"', False),
+    ('"abcd"', False),
+    ("", False),
+    (None, False),
+])
+def test_etag_matches(if_none_match, expected):
+    assert etag_matches(if_none_match, "abc") is expected
@@ -0,0 +1,138 @@
+import mmap
+import os
+
+import pytest
+
+from piframe.utils import render_cache
+from piframe.utils.render_cache import RenderCache
+
+FRAME = bytes(range(256)) * 16
+
+
+@pytest.fixture
+def images(tmp_path):
+    def make(name: str, content: bytes = b"image") -> str:
+        path = tmp_path / "images" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(content)
+        return str(path)
+
+    return make
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RenderCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+
+
+def entry_path(cache: RenderCache, image_path: str) -> str:
+    return cache._entry_path(cache.key(image_path))
+
+
+def test_hit(cache, images):
+    image = images("a.jpg")
+    cache.put(image, FRAME)
+
+    assert cache.contains(image)
+    assert cache.get(image)[:] == FRAME
+
+
+def test_miss_for_unknown_and_missing_images(cache, images):
+    assert cache.get(images("a.jpg")) is None
+    assert cache.get("/does/not/exist.jpg") is None
+    assert not cache.contains("/does/not/exist.jpg")
+
+
+def test_miss_after_pipeline_change(cache, images, monkeypatch):
+    image = images("a.jpg")
+    cache.put(image, FRAME)
+
+    monkeypatch.setattr(render_cache, "GAMMA", render_cache.GAMMA + 0.1)
+    changed = RenderCache(cache.directory, cache.max_bytes)
+
+    assert changed.fingerprint != cache.fingerprint
+    assert changed.get(image) is None
+
+
+def test_miss_after_source_mtime_change(cache, images):
+    image = images("a.jpg")
+    cache.put(image, FRAME)
+
+    stat = os.stat(image)
+    os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert cache.get(image) is None
+
+
+def test_miss_after_source_size_change(cache, images):
+    image = images("a.jpg")
+    cache.put(image, FRAME)
+
+    stat = os.stat(image)
+    with open(image, "ab") as f:
+        f.write(b"more")
+    # Same mtime, only the size tells the files apart
+    os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert cache.get(image) is None
+
+
+def test_get_returns_read_only_map(cache, images):
+    image = images("a.jpg")
+    cache.put(image, FRAME)
+
+    buffer = cache.get(image)
+    assert isinstance(buffer, mmap.mmap)
+    with pytest.raises(TypeError):
+        buffer[0] = 1
+
+
+def test_put_replaces_entry_without_leaving_temporary_files(cache, images):
+    image = images("a.jpg")
+    cache.put(image, FRAME)
+    cache.put(image, FRAME[::-1])
+
+    assert cache.get(image)[:] == FRAME[::-1]
+    assert os.listdir(cache.directory) == [os.path.basename(entry_path(cache, image))]
+    assert cache._total_bytes == len(FRAME)
+
+
+def test_failed_put_keeps_previous_entry(cache, images, monkeypatch):
+    image = images("a.jpg")
+    cache.put(image, FRAME)
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(render_cache.os, "replace", fail)
+    cache.put(image, FRAME[::-1])
+
+    assert cache.get(image)[:] == FRAME
+    assert len(os.listdir(cache.directory)) == 1
+
+
+def test_evicts_least_recently_used_first(tmp_path, images):
+    cache = RenderCache(str(tmp_path / "cache"), max_bytes=3 * len(FRAME))
+    paths = [images(f"{name}.jpg", name.encode()) for name in "abcd"]
+
+    for mtime, image in enumerate(paths[:3], start=1):
+        cache.put(image, FRAME)
+        os.utime(entry_path(cache, image), (mtime, mtime))
+
+    # Using the oldest entry makes b the least recently used one
+    assert cache.get(paths[0]) is not None
+    cache.put(paths[3], FRAME)
+
+    assert [cache.contains(image) for image in paths] == [True, False, True, True]
+    assert cache._total_bytes == 3 * len(FRAME)
+
+
+def test_size_is_restored_after_restart(tmp_path, images):
+    cache = RenderCache(str(tmp_path / "cache"), max_bytes=2 * len(FRAME))
+    for name in "ab":
+        cache.put(images(f"{name}.jpg", name.encode()), FRAME)
+
+    restarted = RenderCache(cache.directory, cache.max_bytes)
+    restarted.put(images("c.jpg", b"c"), FRAME)
+
+    assert len(os.listdir(cache.directory)) == 2
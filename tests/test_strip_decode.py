@@ -0,0 +1,176 @@
+import io
+import struct
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from piframe.utils import source_image
+from piframe.utils.source_image import REDUCIBLE_MODES, SourceImage, _reduce_strips
+from piframe.utils.strip_decode import PNG_SIGNATURE, _png_chunk, _png_chunks, strip_reader
+
+WIDTH, HEIGHT = 157, 211
+
+# Adam7 passes: (x start, y start, x step, y step)
+ADAM7 = [(0, 0, 8, 8), (4, 0, 8, 8), (0, 4, 4, 8), (2, 0, 4, 4), (0, 2, 2, 4), (1, 0, 2, 2), (0, 1, 1, 2)]
+
+
+def noise(mode: str, width: int = WIDTH, height: int = HEIGHT) -> Image.Image:
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+    if mode == "P":
+        return image.quantize(64)
+    return image.convert(mode)
+
+
+def save(image: Image.Image, format: str, **params) -> bytes:
+    out = io.BytesIO()
+    image.save(out, format, **params)
+    return out.getvalue()
+
+
+def interlaced_png(image: Image.Image) -> bytes:
+    """Adam7 interlaced RGB PNG, Pillow only writes non-interlaced ones."""
+    pixels = np.asarray(image.convert("RGB"))
+    raw = b""
+    for x, y, x_step, y_step in ADAM7:
+        sub = pixels[y::y_step, x::x_step]
+        if sub.size:
+            raw += b"".join(b"\x00" + row.tobytes() for row in sub)
+    header = struct.pack(">IIBBBBB", image.width, image.height, 8, 2, 0, 0, 1)
+    return (PNG_SIGNATURE + _png_chunk(b"IHDR", header) + _png_chunk(b"IDAT", zlib.compress(raw))
+            + _png_chunk(b"IEND", b""))
+
+
+def tiled_tiff(image: Image.Image, tile: int = 64) -> bytes:
+    """Uncompressed tiled RGB TIFF, Pillow only writes strips."""
+    pixels = np.asarray(image.convert("RGB"))
+    across, down = -(-image.width // tile), -(-image.height // tile)
+    count = across * down
+
+    tiles = []
+    for ty in range(down):
+        for tx in range(across):
+            block = np.zeros((tile, tile, 3), dtype=np.uint8)
+            part = pixels[ty * tile:(ty + 1) * tile, tx * tile:(tx + 1) * tile]
+            block[:part.shape[0], :part.shape[1]] = part
+            tiles.append(block.tobytes())
+
+    entries = 11
+    extra = 8 + 2 + entries * 12 + 4
+    offsets_at = extra + 6
+    counts_at = offsets_at + 4 * count
+    data_at = counts_at + 4 * count
+
+    def entry(tag, kind, n, value):
+        packed = struct.pack("<I", value) if kind == 4 else struct.pack("<HH", value, 0)
+        return struct.pack("<HHI", tag, kind, n) + packed
+
+    ifd = struct.pack("<H", entries) + b"".join([
+        entry(256, 4, 1, image.width),
+        entry(257, 4, 1, image.height),
+        struct.pack("<HHII", 258, 3, 3, extra),
+        entry(259, 3, 1, 1),
+        entry(262, 3, 1, 2),
+        entry(277, 3, 1, 3),
+        entry(284, 3, 1, 1),
+        entry(322, 4, 1, tile),
+        entry(323, 4, 1, tile),
+        struct.pack("<HHII", 324, 4, count, offsets_at),
+        struct.pack("<HHII", 325, 4, count, counts_at),
+    ]) + struct.pack("<I", 0)
+    offsets = [data_at + i * len(tiles[0]) for i in range(count)]
+    return (b"II*\x00" + struct.pack("<I", 8) + ifd + struct.pack("<HHH", 8, 8, 8)
+            + struct.pack(f"<{count}I", *offsets) + struct.pack(f"<{count}I", *[len(t) for t in tiles])
+            + b"".join(tiles))
+
+
+# name -> (encoded image, whether it can be decoded strip by strip)
+CASES = {
+    "png rgb": (lambda: save(noise("RGB"), "PNG"), True),
+    "png rgba": (lambda: save(noise("RGBA"), "PNG"), True),
+    "png gray": (lambda: save(noise("L"), "PNG"), True),
+    "png gray alpha": (lambda: save(noise("LA"), "PNG"), True),
+    "png palette": (lambda: save(noise("P"), "PNG"), True),
+    "png palette transparency": (lambda: save(noise("P"), "PNG", transparency=3), True),
+    "png multiple idat": (lambda: save(noise("RGB", 700, 400), "PNG", compress_level=0), True),
+    "png interlaced": (lambda: interlaced_png(noise("RGB")), False),
+    "png 16 bit": (lambda: save(noise("I;16"), "PNG"), False),
+    "bmp": (lambda: save(noise("RGB"), "BMP"), True),
+    "ppm": (lambda: save(noise("RGB"), "PPM"), True),
+    "tiff strips": (lambda: save(noise("RGB"), "TIFF", tiffinfo={278: 16}), True),
+    "tiff tiles": (lambda: tiled_tiff(noise("RGB")), False),
+}
+
+
+@pytest.fixture(params=list(CASES))
+def case(request):
+    encode, streamed = CASES[request.param]
+    return encode(), streamed
+
+
+def test_multiple_idat_case_has_several_chunks():
+    data = CASES["png multiple idat"][0]()
+    assert sum(kind == b"IDAT" for kind, _ in _png_chunks(data)) > 1
+
+
+def test_strips_match_whole_decode(case):
+    data, streamed = case
+    image = Image.open(io.BytesIO(data))
+    read = strip_reader(image, data)
+    assert (read is not None) == streamed
+    if read is None:
+        return
+
+    expected = Image.open(io.BytesIO(data))
+    expected.load()
+    # An odd strip height, so strips and PNG chunks or TIFF strips don't line up
+    strips = [read(y, min(7, image.height - y)) for y in range(0, image.height, 7)]
+    assert all(strip.mode == expected.mode for strip in strips)
+    assert b"".join(strip.tobytes() for strip in strips) == expected.tobytes()
+
+
+@pytest.mark.parametrize("factor", [2, 3, 5])
+def test_reduce_strips_matches_pillow_reduce(case, factor, monkeypatch):
+    data, _ = case
+    # Small strips, so every image is reduced over many of them
+    monkeypatch.setattr(source_image, "STRIP_BYTES", 4096)
+
+    image = Image.open(io.BytesIO(data))
+    read = strip_reader(image, data)
+    if read is None:
+        image.load()
+        read = lambda y, rows: image.crop((0, y, image.width, y + rows))
+
+    expected = Image.open(io.BytesIO(data))
+    if expected.mode not in REDUCIBLE_MODES:
+        expected = expected.convert("RGB")
+    expected = expected.reduce(factor)
+
+    reduced = _reduce_strips(image, read, factor)
+    assert reduced.mode == expected.mode
+    assert reduced.size == expected.size
+    assert reduced.tobytes() == expected.tobytes()
+
+
+def test_open_reduces_oversized_source(case, monkeypatch):
+    data, streamed = case
+    monkeypatch.setattr(source_image, "STRIP_BYTES", 4096)
+    monkeypatch.setattr(source_image, "STRIP_PEAK_BYTES", 5 * 4096)
+
+    full = Image.open(io.BytesIO(data))
+    source = SourceImage("image", data)
+    budget = source.decoded_bytes(full, 2, streamed)
+
+    image = source.open(size=None, max_bytes=len(data) + budget)
+
+    reduced = budget < source.decoded_bytes(full)
+    # Streaming leaves room for a reduction that fits, a plain decode may not
+    assert reduced or not streamed
+    if reduced:
+        assert image.size == (-(-full.width // 2), -(-full.height // 2))
+        if full.mode not in REDUCIBLE_MODES:
+            full = full.convert("RGB")
+        full = full.reduce(2)
+    assert image.tobytes() == full.tobytes()
@@ -0,0 +1,244 @@
+import io
+import logging
+import os
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from piframe import main
+from piframe.const import ImageCollection
+from piframe.utils import ingest, upload
+from piframe.utils.image_index import ImageIndex
+from piframe.utils.ingest import Ingestor
+from piframe.utils.metrics import UPLOADS
+from piframe.utils.render_cache import RenderCache
+from piframe.utils.upload import PART_PREFIX, Upload
+
+FRAME = b"\x11" * 64
+
+
+def png(color=(200, 40, 40)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(out, "PNG")
+    return out.getvalue()
+
+
+def files(*names: str, content: bytes | None = None) -> list:
+    return [("files", (name, content if content is not None else png(), "image/png")) for name in names]
+
+
+def uploads_counted(result: str) -> float:
+    return UPLOADS._values.get((result,), 0)
+
+
+class Renderer:
+    """Stands in for pre_process_buffer, holding every render until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, source, dither_threads):
+        self.release.wait(timeout=10)
+        Image.open(io.BytesIO(source.data)).load()
+        return FRAME
+
+
+@pytest.fixture
+def renderer(monkeypatch):
+    renderer = Renderer()
+    monkeypatch.setattr(ingest, "pre_process_buffer", renderer)
+    yield renderer
+    renderer.release.set()
+
+
+@pytest.fixture
+def collection(tmp_path, monkeypatch):
+    monkeypatch.setattr(ImageCollection, "path", lambda self: str(tmp_path / "images" / self.value))
+    return ImageCollection.DEFAULT
+
+
+@pytest.fixture
+def ingestor(tmp_path, renderer, monkeypatch):
+    ingestor = Ingestor(RenderCache(str(tmp_path / "renders")), ImageIndex(str(tmp_path / "library.sqlite")),
+                        max_pending=4)
+    monkeypatch.setattr(main, "ingestor", ingestor)
+    yield ingestor
+    renderer.release.set()
+    ingestor.close()
+
+
+@pytest.fixture
+def client(ingestor, collection):
+    # Without a with block, the lifespan and with it the slideshow never start
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    def set_limits(**limits):
+        for name, value in limits.items():
+            monkeypatch.setitem(upload.receive_uploads.__kwdefaults__, name, value)
+
+    return set_limits
+
+
+def drain(ingestor: Ingestor):
+    """Wait for every submitted upload to be ingested, close() would drop the waiting ones."""
+    deadline = time.monotonic() + 10
+    while ingestor._pending:
+        assert time.monotonic() < deadline, "uploads not ingested in time"
+        time.sleep(0.01)
+
+
+def stored(directory: str) -> list[str]:
+    return sorted(name for name in os.listdir(directory) if not name.startswith(PART_PREFIX))
+
+
+def test_accepts_images(client, ingestor, collection):
+    response = client.post(f"/collection/{collection.value}/images", files=files("a.png", "b.png"))
+
+    assert response.status_code == 202
+    assert response.json() == {"status": "accepted", "accepted": ["a.png", "b.png"], "rejected": []}
+
+    drain(ingestor)
+    assert stored(collection.path()) == ["a.png", "b.png"]
+    assert ingestor.render_cache.get(os.path.join(collection.path(), "a.png"))[:] == FRAME
+    assert sorted(ingestor.image_index.images(collection.path())) == [
+        os.path.join(collection.path(), name) for name in ("a.png", "b.png")
+    ]
+
+
+def test_skips_files_that_are_no_images(client, collection):
+    response = client.post(f"/collection/{collection.value}/images", files=files("notes.txt"))
+
+    assert response.status_code == 202
+    assert response.json()["rejected"] == [{"filename": "notes.txt", "reason": "not an image"}]
+
+
+def test_skips_files_over_the_size_limit(client, ingestor, collection, limits):
+    limits(max_bytes=100)
+    large = png() + b"\0" * 200
+
+    response = client.post(f"/collection/{collection.value}/images",
+                           files=files("large.png", content=large) + files("small.png"))
+
+    assert response.status_code == 202
+    assert response.json()["accepted"] == ["small.png"]
+    assert response.json()["rejected"] == [{"filename": "large.png", "reason": "too large"}]
+    drain(ingestor)
+    assert stored(collection.path()) == ["small.png"]
+
+
+def test_skips_files_past_the_file_limit(client, collection, limits):
+    limits(max_files=2)
+
+    response = client.post(f"/collection/{collection.value}/images", files=files("a.png", "b.png", "c.png", "d.png"))
+
+    assert response.status_code == 202
+    assert response.json()["accepted"] == ["a.png", "b.png"]
+    # Reported once however many files follow
+    assert response.json()["rejected"] == [{"filename": "c.png", "reason": "too many files, at most 2"}]
+
+
+def test_refuses_request_over_the_content_length_limit(client, collection, limits):
+    limits(max_total_bytes=1000)
+
+    response = client.post(f"/collection/{collection.value}/images", files=files(*[f"{n}.png" for n in range(20)]))
+
+    assert response.status_code == 413
+    assert not os.path.exists(collection.path()) or stored(collection.path()) == []
+
+
+def test_refuses_streamed_request_over_the_limit(client, ingestor, collection, limits):
+    limits(max_total_bytes=1000)
+    boundary = "piframe"
+    body = b"".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{n}.png"\r\n'
+        f"Content-Type: image/png\r\n\r\n".encode() + png() + b"\r\n"
+        for n in range(20)
+    ) + f"--{boundary}--\r\n".encode()
+
+    def chunks():
+        for start in range(0, len(body), 256):
+            yield body[start:start + 256]
+
+    # A generator body is sent chunked, without a Content-Length to check up front
+    response = client.post(f"/collection/{collection.value}/images", content=chunks(),
+                           headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+    assert response.status_code == 413
+    drain(ingestor)
+    # Files completed before the limit was hit are kept, nothing half-written is left
+    assert all(not name.startswith(PART_PREFIX) for name in os.listdir(collection.path()))
+
+
+def test_rejects_requests_while_ingestor_is_full(client, ingestor, collection, renderer):
+    renderer.release.clear()
+    for n in range(ingestor.max_pending):
+        client.post(f"/collection/{collection.value}/images", files=files(f"{n}.png"))
+
+    response = client.post(f"/collection/{collection.value}/images", files=files("late.png"))
+
+    assert response.status_code == 503
+
+
+def test_skips_files_once_ingestor_fills_up(client, ingestor, collection, renderer):
+    renderer.release.clear()
+    busy = uploads_counted("busy")
+    names = [f"{n}.png" for n in range(ingestor.max_pending + 2)]
+
+    response = client.post(f"/collection/{collection.value}/images", files=files(*names))
+
+    assert response.status_code == 202
+    accepted, skipped = names[:ingestor.max_pending], names[ingestor.max_pending:]
+    assert response.json()["accepted"] == accepted
+    assert response.json()["rejected"] == [{"filename": name, "reason": "busy"} for name in skipped]
+    assert uploads_counted("busy") == busy + 2
+
+
+def test_ingestor_refuses_uploads_past_max_pending(tmp_path, ingestor, renderer):
+    renderer.release.clear()
+    directory = tmp_path / "images"
+    directory.mkdir()
+
+    def make(name: str) -> Upload:
+        path = tmp_path / f"{name}.part"
+        path.write_bytes(png())
+        return Upload(f"{name}.png", str(path))
+
+    queued = [make(str(n)) for n in range(ingestor.max_pending)]
+    assert all(ingestor.submit(item, str(directory)) for item in queued)
+    assert ingestor.full()
+
+    refused = make("refused")
+    assert not ingestor.submit(refused, str(directory))
+    assert not os.path.exists(refused.tmp_path)
+
+    renderer.release.set()
+    drain(ingestor)
+    assert not ingestor.full()
+    assert stored(str(directory)) == sorted(item.filename for item in queued)
+
+
+def test_ingestor_rejects_undecodable_upload(tmp_path, ingestor, caplog):
+    directory = tmp_path / "images"
+    directory.mkdir()
+    path = tmp_path / "broken.part"
+    path.write_bytes(b"not an image")
+    failed = uploads_counted("failed")
+
+    with caplog.at_level(logging.WARNING, logger=ingest.__name__):
+        assert ingestor.submit(Upload("broken.png", str(path)), str(directory))
+        drain(ingestor)
+
+    assert not path.exists()
+    assert os.listdir(directory) == []
+    assert uploads_counted("failed") == failed + 1
+    record, = [record for record in caplog.records if record.name == ingest.__name__]
+    assert record.levelno == logging.WARNING
+    assert record.exc_info is None
+    assert "broken.png" in record.getMessage() and "not a valid image" in record.getMessage()